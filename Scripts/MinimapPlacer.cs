@@ -3,6 +3,7 @@ using System.Collections.Generic;
 using TMPro;
 using System; // Added for Action
 using UnityEngine.InputSystem; // Added for the new Input System
+using Newtonsoft.Json; // Info panel text for planes received as binary or delta updates
 
 public class RadarDisplay : MonoBehaviour
 {
@@ -42,10 +43,11 @@ public class RadarDisplay : MonoBehaviour
     private Dictionary<string, GameObject> planeObjectsOnRadar = new Dictionary<string, GameObject>();
     private Dictionary<string, float> planeLastUpdateTime = new Dictionary<string, float>(); // Track last update time
     private Dictionary<string, Vector3> planeLastPosition = new Dictionary<string, Vector3>(); // Track last position for smoothing
+    private Dictionary<string, float> planeLastPositionTime = new Dictionary<string, float>(); // When planeLastPosition was set, for the velocity
     private Dictionary<string, Vector3> planeTargetPosition = new Dictionary<string, Vector3>(); // Target position for smooth movement
     private Dictionary<string, Vector3> planeVelocity = new Dictionary<string, Vector3>(); // Interpolated velocity for movement
     private Dictionary<string, PlaneData> planeLastData = new Dictionary<string, PlaneData>(); // Store last known data
-    private Dictionary<string, string> planeRawMessages = new Dictionary<string, string>(); // To store raw JSON messages
+    private Dictionary<string, string> planeRawMessages = new Dictionary<string, string>(); // To store raw JSON messages (null: not sent as JSON, serialized when selected)
     private Dictionary<string, float> planeRealWorldDistances = new Dictionary<string, float>(); // Store real-world distance in meters
     private GameObject centerMarker;
     private List<GameObject> rangeRings = new List<GameObject>();
@@ -53,12 +55,17 @@ public class RadarDisplay : MonoBehaviour
     private List<GameObject> altitudeMarkers = new List<GameObject>(); // Height markers
     private GameObject radarBase;
     private GameObject radarTower; // Central vertical tower
+    private LineRenderer trailLine; // Recent path of the selected plane, from the server's trail store
+    private string trailAddress; // Plane trailLine belongs to
     
     public float staleTimeThreshold = 120f; // Remove planes not updated for 2 minutes (increased from 30s)
     public float updateRateLimit = 0.1f; // Only update plane positions every 0.1 seconds (reduced for more responsiveness)
     public float minimumMovementThreshold = 0.001f; // Only update if plane moved more than 0.1cm (reduced for more sensitivity)
     public float positionSmoothingSpeed = 3f; // How fast to smooth position changes (faster for more responsive movement)
     public float interpolationSpeed = 0.1f; // How fast planes move between updates (simulated movement)
+    public Color trailColor = Color.cyan; // Color of the selected plane's trail
+    public float trailWidth = 0.002f;
+    public bool extrapolateBetweenUpdates = false; // Keep planes moving along their speed/heading between updates, like the relay predicts them (use with DEAD_RECKONING in adsb_server.py)
 
     [Header("UI Control")]
     public bool metricLabelsInitiallyVisible = true; // Visibility of N, S, E, W, km rings, etc.
@@ -367,11 +374,15 @@ public class RadarDisplay : MonoBehaviour
 
     void OnEnable() {
         WebSocketConection.OnPlaneDataReceivedWithRaw += HandlePlaneDataWithRaw;
+        WebSocketConection.OnPlaneRemoved += HandlePlaneRemoved;
+        WebSocketConection.OnTrailReceived += HandleTrailReceived;
         // Ensure other event subscriptions if any are here too e.g. for UserLocationProvider
     }
 
     void OnDisable() {
         WebSocketConection.OnPlaneDataReceivedWithRaw -= HandlePlaneDataWithRaw;
+        WebSocketConection.OnPlaneRemoved -= HandlePlaneRemoved;
+        WebSocketConection.OnTrailReceived -= HandleTrailReceived;
         // Ensure other event unsubscriptions if any are here too
     }
 
@@ -384,6 +395,68 @@ public class RadarDisplay : MonoBehaviour
         }
     }
 
+    // The server dropped this plane as stale, no need to wait for our own staleTimeThreshold
+    void HandlePlaneRemoved(string address) {
+        Debug.Log("🗑️ Server removed plane " + address);
+        RemovePlaneFromRadar(address);
+    }
+
+    // Trail of the plane that was just tapped, drawn as a line through its past radar positions
+    void HandleTrailReceived(string address, List<double[]> points) {
+        RadarPlaneIcon selectedIcon = currentlySelectedPlaneIcon != null ? currentlySelectedPlaneIcon.GetComponent<RadarPlaneIcon>() : null;
+        if (selectedIcon == null || selectedIcon.planeAddress != address) {
+            return; // Selection changed while the request was underway
+        }
+        if (trailLine == null) {
+            GameObject trailObj = new GameObject("PlaneTrail");
+            trailObj.transform.SetParent(transform, false);
+            trailLine = trailObj.AddComponent<LineRenderer>();
+            trailLine.useWorldSpace = false;
+            trailLine.material = new Material(Shader.Find("Sprites/Default"));
+        }
+        trailLine.startColor = new Color(trailColor.r, trailColor.g, trailColor.b, 0.1f); // Fades towards the oldest point
+        trailLine.endColor = trailColor;
+        trailLine.startWidth = trailWidth;
+        trailLine.endWidth = trailWidth;
+
+        var positions = new List<Vector3>(points.Count);
+        float lastAltitudeFeet = 0f;
+        foreach (double[] point in points) {
+            if (!double.IsNaN(point[2])) lastAltitudeFeet = (float)point[2];
+            positions.Add(GeoToRadarPosition((float)point[0], (float)point[1], lastAltitudeFeet));
+        }
+        trailLine.positionCount = positions.Count;
+        trailLine.SetPositions(positions.ToArray());
+        trailLine.gameObject.SetActive(positions.Count > 1);
+        trailAddress = address;
+        Debug.Log("🛤️ Drew trail for " + address + " with " + positions.Count + " points");
+    }
+
+    void HideTrail() {
+        if (trailLine != null) trailLine.gameObject.SetActive(false);
+        trailAddress = null;
+    }
+
+    // Same mapping as UpdateOrCreatePlaneOnRadar: offset from the user scaled to the radar, altitude above the user on Y
+    Vector3 GeoToRadarPosition(float latitude, float longitude, float altitudeFeet) {
+        float userLat = useTestLocation ? testLatitude : UserLocationProvider.Instance.CurrentLatitude;
+        float userLon = useTestLocation ? testLongitude : UserLocationProvider.Instance.CurrentLongitude;
+        float userAlt = useTestLocation ? testAltitude : UserLocationProvider.Instance.CurrentAltitude;
+        float radarScaleFactor = radarDisplayRadiusMeters / (radarRealWorldRangeKm * 1000f);
+        float x = (longitude - userLon) * 111320f * Mathf.Cos(userLat * Mathf.Deg2Rad) * radarScaleFactor;
+        float z = (latitude - userLat) * 111133f * radarScaleFactor;
+        float y = radarBaseHeight + ((altitudeFeet * 0.3048f - userAlt) * radarAltitudeScale);
+        return new Vector3(x, y, z);
+    }
+
+    // Radar-space velocity of a plane flying speedKnots on headingDegrees, same flat-earth step as predict_position in adsb_server.py
+    Vector3 GroundVelocity(float speedKnots, float headingDegrees) {
+        float radarScaleFactor = radarDisplayRadiusMeters / (radarRealWorldRangeKm * 1000f);
+        float metersPerSecond = speedKnots * 1852f / 3600f;
+        float track = headingDegrees * Mathf.Deg2Rad;
+        return new Vector3(Mathf.Sin(track), 0f, Mathf.Cos(track)) * (metersPerSecond * radarScaleFactor);
+    }
+
     // Call this from PlaneManagerRA
     public void UpdateOrCreatePlaneOnRadar(PlaneData planeData)
     {
@@ -612,6 +685,12 @@ public class RadarDisplay : MonoBehaviour
             Debug.Log("🔄 Reactivated plane icon for " + planeData.address);
         }
 
+        // Extrapolate along the reported speed and heading, the same prediction the relay's dead reckoning checks against
+        if (planeData.speed.HasValue && planeData.heading.HasValue)
+        {
+            planeVelocity[planeData.address] = GroundVelocity(planeData.speed.Value, planeData.heading.Value);
+        }
+
         // Only update position if rate limiting allows it
         if (shouldUpdatePosition)
         {
@@ -626,10 +705,11 @@ public class RadarDisplay : MonoBehaviour
                 // TEMPORARILY DISABLED RANGE CHECK FOR EXISTING PLANES
                 // Debug.Log($"✅ Updating position for {planeData.address} (range check disabled)");
                 
-                // Calculate velocity for interpolation (only for existing planes)
-                if (!isNewPlane && planeLastPosition.ContainsKey(planeData.address) && planeLastUpdateTime.ContainsKey(planeData.address))
+                // Without speed/heading, fall back to the velocity between the last two positions (the relay does the same)
+                if (!(planeData.speed.HasValue && planeData.heading.HasValue) &&
+                    !isNewPlane && planeLastPosition.ContainsKey(planeData.address) && planeLastPositionTime.ContainsKey(planeData.address))
                 {
-                    float deltaTime = Time.time - planeLastUpdateTime[planeData.address];
+                    float deltaTime = Time.time - planeLastPositionTime[planeData.address];
                     if (deltaTime > 0.1f) // Only calculate if enough time has passed
                     {
                         Vector3 positionDelta = newPosition - planeLastPosition[planeData.address];
@@ -658,6 +738,7 @@ public class RadarDisplay : MonoBehaviour
                 // Update last update time and position
                 planeLastUpdateTime[planeData.address] = Time.time;
                 planeLastPosition[planeData.address] = newPosition;
+                planeLastPositionTime[planeData.address] = Time.time;
                 
                 Debug.Log("⏰ Updated position and timestamp for " + planeData.address + " at " + Time.time.ToString("F1"));
             }
@@ -752,6 +833,7 @@ public class RadarDisplay : MonoBehaviour
     // --- Highlighting Logic ---
     void ClearHighlight()
     {
+        HideTrail();
         if (currentlySelectedPlaneIcon != null)
         {
             // Check if the renderer still exists before trying to modify it
@@ -816,8 +898,12 @@ public class RadarDisplay : MonoBehaviour
                     if (planeLastData.TryGetValue(clickedIcon.planeAddress, out PlaneData selectedPlaneData) &&
                         planeRealWorldDistances.TryGetValue(clickedIcon.planeAddress, out float distanceMeters))
                     {
-                        // Raw message is optional, especially for demo planes
-                        planeRawMessages.TryGetValue(clickedIcon.planeAddress, out string rawMessage);
+                        // Raw message is optional, especially for demo planes. Binary and delta updates carry none,
+                        // so their data is only serialized here, when the info panel needs it
+                        if (planeRawMessages.TryGetValue(clickedIcon.planeAddress, out string rawMessage) && rawMessage == null)
+                        {
+                            rawMessage = JsonConvert.SerializeObject(selectedPlaneData);
+                        }
                         rawMessage = rawMessage ?? "N/A (demo plane or no raw data received)";
 
                         Debug.Log("Plane icon clicked: " + clickedIcon.planeAddress + ". Firing OnPlaneSelectedForInfoRaw event.");
@@ -831,7 +917,7 @@ public class RadarDisplay : MonoBehaviour
             }
         }
 
-        // Simplified interpolation - only move toward target positions, no extrapolation
+        // Simplified interpolation - move toward target positions, extrapolated along the last velocity if enabled
         foreach (var kvp in planeObjectsOnRadar)
         {
             string planeId = kvp.Key;
@@ -839,6 +925,12 @@ public class RadarDisplay : MonoBehaviour
             
             if (planeIcon != null && planeIcon.activeInHierarchy && planeTargetPosition.ContainsKey(planeId))
             {
+                if (extrapolateBetweenUpdates && planeVelocity.TryGetValue(planeId, out Vector3 velocity))
+                {
+                    // The relay only sends a new position once the plane is off this predicted track
+                    planeTargetPosition[planeId] += velocity * Time.deltaTime;
+                }
+
                 Vector3 currentPos = planeIcon.transform.localPosition;
                 Vector3 targetPos = planeTargetPosition[planeId];
                 
@@ -891,26 +983,34 @@ public class RadarDisplay : MonoBehaviour
 
         foreach (var plane in planesToRemove)
         {
-            if (planeObjectsOnRadar.TryGetValue(plane, out GameObject obj))
-            {
-                // If the plane being removed is the currently highlighted one, clear the reference
-                // so we don't try to access a destroyed object.
-                if (obj == currentlySelectedPlaneIcon)
-                {
-                    currentlySelectedPlaneIcon = null;
-                }
+            Debug.Log("🗑️ Removing stale plane " + plane + " (not updated for " + staleTimeThreshold.ToString("F1") + "s)");
+            RemovePlaneFromRadar(plane);
+        }
+    }
 
-                Debug.Log("🗑️ Removing stale plane " + plane + " (not updated for " + staleTimeThreshold.ToString("F1") + "s)");
-                obj.SetActive(false);
-                Destroy(obj);
-                planeObjectsOnRadar.Remove(plane);
-                planeLastUpdateTime.Remove(plane);
-                planeLastPosition.Remove(plane);
-                planeTargetPosition.Remove(plane);
-                planeVelocity.Remove(plane);
-                planeLastData.Remove(plane);
-                planeRealWorldDistances.Remove(plane); // Clean up distance data
+    void RemovePlaneFromRadar(string plane)
+    {
+        if (planeObjectsOnRadar.TryGetValue(plane, out GameObject obj))
+        {
+            // If the plane being removed is the currently highlighted one, clear the reference
+            // so we don't try to access a destroyed object.
+            if (obj == currentlySelectedPlaneIcon)
+            {
+                currentlySelectedPlaneIcon = null;
             }
-        }
+
+            obj.SetActive(false);
+            Destroy(obj);
+            planeObjectsOnRadar.Remove(plane);
+        }
+        planeLastUpdateTime.Remove(plane);
+        planeLastPosition.Remove(plane);
+        planeLastPositionTime.Remove(plane);
+        if (plane == trailAddress) HideTrail();
+        planeTargetPosition.Remove(plane);
+        planeVelocity.Remove(plane);
+        planeLastData.Remove(plane);
+        planeRawMessages.Remove(plane);
+        planeRealWorldDistances.Remove(plane); // Clean up distance data
     }
 }
\ No newline at end of file
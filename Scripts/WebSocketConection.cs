@@ -1,25 +1,59 @@
 // WebSocketController.cs
 using UnityEngine;
 using System;
+using System.Collections.Generic;
 using NativeWebSocket; // Make sure this matches the namespace of your imported asset
 using Newtonsoft.Json; // For robust JSON parsing
+using Newtonsoft.Json.Linq; // For server envelope messages (snapshot etc.)
 
 public class WebSocketConection : MonoBehaviour
 {
     public string serverURL = "ws://192.168.0.230:9000";
+    public bool subscribeToRadarRange = false; // Ask the server to only send aircraft within subscriptionRadiusKm of the user
+    public float subscriptionRadiusKm = 100f; // Keep in line with RadarDisplay.radarRealWorldRangeKm
+    public bool useDeltaUpdates = false; // Server only sends changed fields per plane, merged back into full PlaneData here
+    public bool useBatchedUpdates = false; // Server sends all plane updates of a short time window in one frame
+    public bool useBinaryFormat = false; // Server sends plane data in the compact adsb.bin.v1 format instead of JSON
+    public bool requestTrailOnSelect = true; // Ask the server for the recent path of a tapped plane (drawn by RadarDisplay)
+    private const byte BinaryFormatVersion = 1; // First byte of every binary frame (JSON frames start with '{')
     private WebSocket websocket;
+    private readonly Dictionary<string, PlaneData> knownPlanes = new Dictionary<string, PlaneData>(); // Delta mode: merged data per plane
 
     // Event to notify other parts of the application when new data arrives
     public static event Action<PlaneData> OnPlaneDataReceived;
-    public static event Action<PlaneData, string> OnPlaneDataReceivedWithRaw; // New event with raw JSON
+    public static event Action<PlaneData, string> OnPlaneDataReceivedWithRaw; // New event with raw JSON (null for binary and delta updates, serialize only if needed)
+    public static event Action<string> OnPlaneRemoved; // Server dropped a stale plane (address)
+    public static event Action<string, List<double[]>> OnTrailReceived; // Address and its [latitude, longitude, altitude (NaN if unknown), time] points, oldest first
+
+    void OnEnable()
+    {
+        RadarDisplay.OnPlaneSelectedForInfoRaw += HandlePlaneSelected;
+    }
+
+    void OnDisable()
+    {
+        RadarDisplay.OnPlaneSelectedForInfoRaw -= HandlePlaneSelected;
+    }
+
+    void HandlePlaneSelected(PlaneData plane, string rawMessage, float distanceKm)
+    {
+        if (requestTrailOnSelect && plane != null && !string.IsNullOrEmpty(plane.address))
+        {
+            RequestTrail(plane.address);
+        }
+    }
 
     async void Start()
     {
-        websocket = new WebSocket(serverURL);
+        websocket = new WebSocket(BuildConnectionUrl());
 
         websocket.OnOpen += () =>
         {
             Debug.Log("WebSocket Connection open!");
+            if (subscribeToRadarRange && UserLocationProvider.Instance != null && UserLocationProvider.Instance.IsLocationServiceRunning)
+            {
+                Subscribe(UserLocationProvider.Instance.CurrentLatitude, UserLocationProvider.Instance.CurrentLongitude, subscriptionRadiusKm);
+            }
         };
 
         websocket.OnError += (e) =>
@@ -34,6 +68,12 @@ public class WebSocketConection : MonoBehaviour
 
         websocket.OnMessage += (bytes) =>
         {
+            if (useBinaryFormat && bytes.Length > 0 && bytes[0] == BinaryFormatVersion)
+            {
+                ProcessBinaryMessage(bytes);
+                return;
+            }
+
             var message = System.Text.Encoding.UTF8.GetString(bytes);
             // Debug.Log("Raw Message from server: " + message); // Optional: log raw message
 
@@ -41,7 +81,7 @@ public class WebSocketConection : MonoBehaviour
             ProcessMessage(message);
         };
 
-        Debug.Log($"Attempting to connect WebSocket to: {serverURL}");
+        Debug.Log($"Attempting to connect WebSocket to: {BuildConnectionUrl()}");
         // Important: NativeWebSocket's Connect() is asynchronous.
         // You need to `await` it or handle its completion.
         try
@@ -66,27 +106,187 @@ public class WebSocketConection : MonoBehaviour
 #endif
     }
 
+    // Connection options are passed to the server as query parameters
+    private string BuildConnectionUrl()
+    {
+        List<string> options = new List<string>();
+        if (useDeltaUpdates) options.Add("delta=1");
+        if (useBatchedUpdates) options.Add("batch=1");
+        if (useBinaryFormat) options.Add("format=bin");
+        if (options.Count == 0) return serverURL;
+        return serverURL + (serverURL.Contains("?") ? "&" : "?") + string.Join("&", options);
+    }
+
+    // Server-side geofence: only aircraft within radiusKm of this point are sent from now on
+    public async void Subscribe(float latitude, float longitude, float radiusKm)
+    {
+        if (websocket == null || websocket.State != WebSocketState.Open)
+        {
+            Debug.LogWarning("Cannot subscribe, WebSocket is not open.");
+            return;
+        }
+        string message = JsonConvert.SerializeObject(new { type = "subscribe", latitude = latitude, longitude = longitude, radius_km = radiusKm });
+        Debug.Log("Sending subscription: " + message);
+        await websocket.SendText(message);
+    }
+
+    // The server answers with a {"type": "trail"} message, passed on through OnTrailReceived
+    public async void RequestTrail(string address)
+    {
+        if (websocket == null || websocket.State != WebSocketState.Open)
+        {
+            Debug.LogWarning("Cannot request trail, WebSocket is not open.");
+            return;
+        }
+        await websocket.SendText(JsonConvert.SerializeObject(new { type = "trail", address = address }));
+    }
+
     private void ProcessMessage(string jsonString)
     {
         try
         {
+            // Server envelopes always start with their "type" key; plain plane updates never have one
+            if (jsonString.StartsWith("{\"type\""))
+            {
+                ProcessServerMessage(JObject.Parse(jsonString));
+                return;
+            }
+
             PlaneData data = JsonConvert.DeserializeObject<PlaneData>(jsonString);
+            DispatchPlaneData(data, jsonString);
+        }
+        catch (Exception e)
+        {
+            Debug.LogError($"Failed to parse JSON message: {jsonString}\nError: {e.Message}\nStackTrace: {e.StackTrace}");
+        }
+    }
+
+    private void ProcessServerMessage(JObject message)
+    {
+        string type = (string)message["type"];
+        switch (type)
+        {
+            case "snapshot": // All aircraft the server is tracking, sent once right after connecting
+            case "batch": // Latest update of every plane that changed during the server's batch window
+                JArray aircraft = message["aircraft"] as JArray;
+                if (aircraft == null) return;
+                Debug.Log($"WebSocket received {type} with {aircraft.Count} aircraft");
+                foreach (JToken item in aircraft)
+                {
+                    DispatchPlaneData(item.ToObject<PlaneData>(), item.ToString(Formatting.None));
+                }
+                break;
+            case "remove":
+                // Planes the server stopped tracking because they went stale
+                JArray addresses = message["addresses"] as JArray;
+                if (addresses == null) return;
+                foreach (JToken address in addresses)
+                {
+                    knownPlanes.Remove((string)address);
+                    OnPlaneRemoved?.Invoke((string)address);
+                }
+                break;
+            case "trail":
+                // Recent positions of one plane, answer to RequestTrail
+                JArray points = message["points"] as JArray;
+                if (points == null) return;
+                var trail = new List<double[]>(points.Count);
+                foreach (JToken point in points)
+                {
+                    trail.Add(new double[] {
+                        (double)point[0], (double)point[1],
+                        point[2].Type == JTokenType.Null ? double.NaN : (double)point[2],
+                        (double)point[3] });
+                }
+                OnTrailReceived?.Invoke((string)message["address"], trail);
+                break;
+            default:
+                Debug.LogWarning("Received unknown server message type: " + type);
+                break;
+        }
+    }
 
-            if (data != null && !string.IsNullOrEmpty(data.address))
+    // adsb.bin.v1 frames: <BBH header (version, frame type, count) then fixed 20-byte plane records,
+    // see the format description in adsb_server.py. BinaryReader reads little-endian like the server writes.
+    private void ProcessBinaryMessage(byte[] bytes)
+    {
+        try
+        {
+            using (var reader = new System.IO.BinaryReader(new System.IO.MemoryStream(bytes)))
             {
-                Debug.Log($"WebSocket received plane data: {data.ToString()}"); // Enable detailed logging
-                OnPlaneDataReceived?.Invoke(data); // Notify subscribers
-                OnPlaneDataReceivedWithRaw?.Invoke(data, jsonString); // Notify subscribers with raw JSON
+                reader.ReadByte(); // format version
+                byte frameType = reader.ReadByte();
+                int count = reader.ReadUInt16();
+                for (int i = 0; i < count; i++)
+                {
+                    string address = BitConverter.ToString(reader.ReadBytes(3)).Replace("-", "").ToLowerInvariant();
+                    if (frameType == 4) // remove
+                    {
+                        knownPlanes.Remove(address);
+                        OnPlaneRemoved?.Invoke(address);
+                        continue;
+                    }
+
+                    byte flags = reader.ReadByte();
+                    int latitudeE7 = reader.ReadInt32();
+                    int longitudeE7 = reader.ReadInt32();
+                    int altitudeFeet = reader.ReadInt32();
+                    ushort speedTenths = reader.ReadUInt16();
+                    ushort headingHundredths = reader.ReadUInt16();
+
+                    PlaneData data = new PlaneData { address = address };
+                    if ((flags & 1) != 0) { data.latitude = latitudeE7 / 1e7f; data.longitude = longitudeE7 / 1e7f; }
+                    if ((flags & 2) != 0) data.altitude = altitudeFeet;
+                    if ((flags & 4) != 0) data.speed = speedTenths / 10f;
+                    if ((flags & 8) != 0) data.heading = headingHundredths / 100f;
+                    if ((flags & 16) != 0) data.callsign = System.Text.Encoding.ASCII.GetString(reader.ReadBytes(8)).TrimEnd();
+                    DispatchPlaneData(data, null);
+                }
             }
-            else
+        }
+        catch (Exception e)
+        {
+            Debug.LogError($"Failed to parse binary message ({bytes.Length} bytes): {e.Message}");
+        }
+    }
+
+    private void DispatchPlaneData(PlaneData data, string rawJson)
+    {
+        if (data != null && !string.IsNullOrEmpty(data.address))
+        {
+            if (useDeltaUpdates)
             {
-                Debug.LogWarning("Received message could not be parsed into PlaneData or address is missing: " + jsonString);
+                data = MergeDelta(data);
+                rawJson = null; // The delta alone is not the full picture
             }
+            Debug.Log($"WebSocket received plane data: {data.ToString()}"); // Enable detailed logging
+            OnPlaneDataReceived?.Invoke(data); // Notify subscribers
+            OnPlaneDataReceivedWithRaw?.Invoke(data, rawJson); // Notify subscribers with raw JSON, if the update came as JSON
         }
-        catch (Exception e)
+        else
         {
-            Debug.LogError($"Failed to parse JSON message: {jsonString}\nError: {e.Message}\nStackTrace: {e.StackTrace}");
+            Debug.LogWarning("Received message could not be parsed into PlaneData or address is missing: " + rawJson);
+        }
+    }
+
+    // Delta mode: fields missing from an update keep their last known value
+    private PlaneData MergeDelta(PlaneData delta)
+    {
+        if (!knownPlanes.TryGetValue(delta.address, out PlaneData plane))
+        {
+            knownPlanes[delta.address] = delta;
+            return delta;
         }
+        plane.altitude = delta.altitude ?? plane.altitude;
+        plane.latitude = delta.latitude ?? plane.latitude;
+        plane.longitude = delta.longitude ?? plane.longitude;
+        plane.speed = delta.speed ?? plane.speed;
+        plane.heading = delta.heading ?? plane.heading;
+        plane.callsign = delta.callsign ?? plane.callsign;
+        plane.timestamp = delta.timestamp ?? plane.timestamp;
+        plane.rssi = delta.rssi ?? plane.rssi;
+        plane.receiver = delta.receiver ?? plane.receiver;
+        return plane;
     }
 
     private async void OnApplicationQuit()
@@ -0,0 +1,370 @@
+"""Recording of upstream ADS-B traffic to rotating, compressed, append-only segment files, and reading it back.
+
+Segment file layout (little-endian):
+  file header  b"ADSBSEG1"
+  block        <III compressed size, raw size, frame count, followed by a zlib stream holding that many frames
+  frame        <ddHI monotonic receive time, wall clock time, source length, payload length,
+               followed by the source (upstream URI) and the payload (the upstream message as received)
+Every block is compressed on its own, so a reader can start at any block boundary and a crash only loses
+the block being written.
+
+Next to every segment a sparse index (same name, .idx) lets readers seek without decompressing:
+  file header  b"ADSBIDX1"
+  entry        <dQB wall clock time of the block's first frame, block offset in the segment, flags
+Blocks flagged INDEX_KEYFRAME start with a keyframe: a frame from KEYFRAME_SOURCE whose payload is a
+{"type": "snapshot"} of every tracked aircraft, so a replay can start there instead of at the beginning.
+"""
+import logging
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+from datetime import date, datetime, timedelta
+
+SEGMENT_MAGIC = b"ADSBSEG1"
+SEGMENT_SUFFIX = ".seg"
+INDEX_MAGIC = b"ADSBIDX1"
+INDEX_SUFFIX = ".idx"
+INDEX_KEYFRAME = 1
+KEYFRAME_SOURCE = "keyframe"
+_BLOCK_HEADER = struct.Struct("<III")
+_FRAME_HEADER = struct.Struct("<ddHI")
+_INDEX_ENTRY = struct.Struct("<dQB")
+_STOP = object()
+_index_cache = {} # Segment path -> (versions of the segment and its index file, index entries)
+
+logger = logging.getLogger(__name__)
+
+
+class Recorder:
+    """Appends upstream frames to segment files from a background thread.
+    record() only puts the frame on a queue, so recording never blocks the event loop; frames are collected into
+    blocks of block_bytes (or whatever arrived within flush_seconds), compressed and written by the thread.
+    A new segment is started once the current one reaches segment_bytes or segment_seconds.
+    Keyframes always start a new block, so the index can point straight at them."""
+
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024, segment_seconds: float = 3600.0,
+                 block_bytes: int = 256 * 1024, flush_seconds: float = 1.0, queue_maxsize: int = 100000,
+                 compression_level: int = 6):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.block_bytes = block_bytes
+        self.flush_seconds = flush_seconds
+        self.compression_level = compression_level
+        self.frames = 0   # Frames handed to the writer thread
+        self.dropped = 0  # Frames lost because the queue was full (disk too slow)
+        self.blocks = 0
+        self.bytes_written = 0
+        self.segment_path = None
+        self._queue = queue.Queue(maxsize=queue_maxsize)
+        self._thread = threading.Thread(target=self._run, name="Recorder", daemon=True)
+        self._segment = None
+        self._index = None
+        self._segment_opened = 0.0
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread.start()
+        logger.info(f"Recording upstream traffic to {os.path.abspath(self.directory)}")
+
+    def record(self, source: str, payload):
+        """Queues one upstream message (str or bytes) with its receive time. Safe to call from the event loop."""
+        try:
+            self._queue.put_nowait((time.monotonic(), time.time(), source, payload))
+            self.frames += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def record_keyframe(self, snapshot: str):
+        """Queues a {"type": "snapshot"} of the aircraft table as a keyframe to seek to."""
+        self.record(KEYFRAME_SOURCE, snapshot)
+
+    def close(self, timeout: float = 10.0):
+        """Writes out everything queued so far and stops the writer thread."""
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.warning("Recorder queue still full at shutdown, the last frames are lost.")
+            return
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            "frames": self.frames,
+            "dropped": self.dropped,
+            "blocks": self.blocks,
+            "bytes_written": self.bytes_written,
+            "segment": self.segment_path,
+        }
+
+    def _run(self):
+        block = bytearray()
+        count = 0
+        block_started = 0.0
+        block_wall_time = 0.0
+        block_flags = 0
+        while True:
+            timeout = None
+            if count:
+                timeout = max(0.0, self.flush_seconds - (time.monotonic() - block_started))
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                break
+            if item is not None:
+                received_at, wall_time, source, payload = item
+                source_bytes = source.encode("utf-8")
+                if isinstance(payload, str):
+                    payload = payload.encode("utf-8")
+                keyframe = source == KEYFRAME_SOURCE
+                if keyframe and count:
+                    self._write_block(block, count, block_wall_time, block_flags)
+                    block = bytearray()
+                    count = 0
+                if not count:
+                    block_started = time.monotonic()
+                    block_wall_time = wall_time
+                    block_flags = INDEX_KEYFRAME if keyframe else 0
+                block += _FRAME_HEADER.pack(received_at, wall_time, len(source_bytes), len(payload))
+                block += source_bytes
+                block += payload
+                count += 1
+            if count and (len(block) >= self.block_bytes or time.monotonic() - block_started >= self.flush_seconds):
+                self._write_block(block, count, block_wall_time, block_flags)
+                block = bytearray()
+                count = 0
+        if count:
+            self._write_block(block, count, block_wall_time, block_flags)
+        self._close_segment()
+
+    def _write_block(self, raw: bytearray, count: int, wall_time: float, flags: int):
+        try:
+            if self._segment is None or self._segment.tell() >= self.segment_bytes or \
+                    time.monotonic() - self._segment_opened >= self.segment_seconds:
+                self._open_segment()
+            data = zlib.compress(raw, self.compression_level)
+            offset = self._segment.tell()
+            self._segment.write(_BLOCK_HEADER.pack(len(data), len(raw), count))
+            self._segment.write(data)
+            self._segment.flush()
+            self._index.write(_INDEX_ENTRY.pack(wall_time, offset, flags))
+            self._index.flush()
+            self.blocks += 1
+            self.bytes_written += _BLOCK_HEADER.size + len(data)
+        except OSError as e:
+            logger.error(f"Recorder could not write {count} frames to {self.segment_path}: {e}")
+
+    def _close_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+            self._index.close()
+            self._segment = None
+            self._index = None
+
+    def _open_segment(self):
+        self._close_segment()
+        name = time.strftime("adsb-%Y%m%d-%H%M%S")
+        sequence = 0
+        path = os.path.join(self.directory, f"{name}-{sequence:03d}{SEGMENT_SUFFIX}")
+        while os.path.exists(path): # Rotated more than once within a second
+            sequence += 1
+            path = os.path.join(self.directory, f"{name}-{sequence:03d}{SEGMENT_SUFFIX}")
+        self._segment = open(path, "wb")
+        self._segment.write(SEGMENT_MAGIC)
+        self._index = open(index_path(path), "wb")
+        self._index.write(INDEX_MAGIC)
+        self._segment_opened = time.monotonic()
+        self.segment_path = path
+        logger.info(f"Recorder started segment {path}")
+
+
+def segment_paths(directory: str) -> list:
+    """Segment files in a recording directory, oldest first (their names sort by start time)."""
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+
+
+def index_path(segment_path: str) -> str:
+    return segment_path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX if segment_path.endswith(SEGMENT_SUFFIX) else segment_path + INDEX_SUFFIX
+
+
+def _file_version(path: str):
+    """(size, modification time) of a file, None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def read_index(segment_path: str) -> list:
+    """(wall time, block offset, flags) of every block in a segment, from its .idx file.
+    Segments without one are indexed by reading just the first frame header of every block.
+    The entries are cached until the segment or its index changes; do not modify the returned list."""
+    versions = _file_version(segment_path), _file_version(index_path(segment_path))
+    cached = _index_cache.get(segment_path)
+    if cached is not None and cached[0] == versions:
+        return cached[1]
+    entries = _read_index(segment_path)
+    _index_cache[segment_path] = versions, entries
+    return entries
+
+
+def _read_index(segment_path: str) -> list:
+    try:
+        with open(index_path(segment_path), "rb") as index:
+            data = index.read()
+    except FileNotFoundError:
+        return scan_index(segment_path)
+    if not data.startswith(INDEX_MAGIC):
+        raise ValueError(f"{index_path(segment_path)} is not an ADS-B recording index")
+    end = len(INDEX_MAGIC) + (len(data) - len(INDEX_MAGIC)) // _INDEX_ENTRY.size * _INDEX_ENTRY.size
+    return list(_INDEX_ENTRY.iter_unpack(data[len(INDEX_MAGIC):end]))
+
+
+def scan_index(segment_path: str) -> list:
+    """Builds the index entries of a segment by walking its block headers. Only the start of every block
+    is decompressed, and the rest of the memory-mapped file is never touched."""
+    entries = []
+    with open(segment_path, "rb") as segment:
+        if os.fstat(segment.fileno()).st_size < len(SEGMENT_MAGIC):
+            raise ValueError(f"{segment_path} is not an ADS-B recording segment")
+        with mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+            if view[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+                raise ValueError(f"{segment_path} is not an ADS-B recording segment")
+            position = len(SEGMENT_MAGIC)
+            while position + _BLOCK_HEADER.size <= len(view):
+                compressed_size, _, _ = _BLOCK_HEADER.unpack_from(view, position)
+                start = position + _BLOCK_HEADER.size
+                if start + compressed_size > len(view):
+                    break
+                with view[start:start + compressed_size] as compressed:
+                    first = zlib.decompressobj().decompress(compressed, _FRAME_HEADER.size + len(KEYFRAME_SOURCE))
+                _, wall_time, source_length, _ = _FRAME_HEADER.unpack_from(first)
+                keyframe = first[_FRAME_HEADER.size:_FRAME_HEADER.size + source_length] == KEYFRAME_SOURCE.encode("utf-8")
+                entries.append((wall_time, position, INDEX_KEYFRAME if keyframe else 0))
+                position = start + compressed_size
+    return entries
+
+
+def iter_frames(path: str, offset: int = None):
+    """Yields (monotonic time, wall time, source, payload) for every frame in a segment file, starting at the
+    block at offset (from the index) if given. The segment is memory-mapped and decompressed one block at a
+    time, so memory stays flat however big it is; payloads are memoryview slices of their block (use
+    bytes(payload) to keep one). A truncated last block (recorder killed mid-write) ends the segment."""
+    with open(path, "rb") as segment:
+        if os.fstat(segment.fileno()).st_size < len(SEGMENT_MAGIC):
+            raise ValueError(f"{path} is not an ADS-B recording segment")
+        with mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+            if view[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+                raise ValueError(f"{path} is not an ADS-B recording segment")
+            yield from _iter_blocks(path, view, len(SEGMENT_MAGIC) if offset is None else offset)
+
+
+def _iter_blocks(path: str, view: memoryview, position: int):
+    size = len(view)
+    sources = {} # Encoded source -> str, there are only a few per recording
+    while position + _BLOCK_HEADER.size <= size:
+        compressed_size, _, count = _BLOCK_HEADER.unpack_from(view, position)
+        position += _BLOCK_HEADER.size
+        if position + compressed_size > size:
+            logger.warning(f"Truncated block at the end of {path}")
+            return
+        with view[position:position + compressed_size] as compressed:
+            raw = zlib.decompress(compressed)
+        position += compressed_size
+        payloads = memoryview(raw)
+        offset = 0
+        for _ in range(count):
+            received_at, wall_time, source_length, payload_length = _FRAME_HEADER.unpack_from(raw, offset)
+            offset += _FRAME_HEADER.size
+            source_bytes = raw[offset:offset + source_length]
+            source = sources.get(source_bytes)
+            if source is None:
+                source = sources[source_bytes] = source_bytes.decode("utf-8")
+            offset += source_length
+            yield received_at, wall_time, source, payloads[offset:offset + payload_length]
+            offset += payload_length
+
+
+def recording_paths(path: str) -> list:
+    """Segments of a recording given as one segment file or a recording directory."""
+    if os.path.isdir(path):
+        return segment_paths(path)
+    return [path]
+
+
+def iter_recording(path: str, start_time: float = None):
+    """Yields the frames of every segment of a recording in order, see iter_frames. With start_time
+    (wall clock), starts at the last keyframe before it; frames between the keyframe and start_time
+    are yielded too, for the reader to fast-forward through."""
+    paths = recording_paths(path)
+    first_segment, offset = 0, None
+    if start_time is not None:
+        first_segment, offset = find_keyframe(paths, start_time)
+    for number, segment_path in enumerate(paths[first_segment:]):
+        yield from iter_frames(segment_path, offset if number == 0 else None)
+
+
+def find_keyframe(paths: list, start_time: float):
+    """(segment number, block offset) of the last keyframe at or before start_time, (0, None) if there is none."""
+    found = 0, None
+    for number, segment_path in enumerate(paths):
+        for wall_time, offset, flags in read_index(segment_path):
+            if wall_time > start_time:
+                return found
+            if flags & INDEX_KEYFRAME:
+                found = number, offset
+    return found
+
+
+def recording_range(path: str):
+    """Wall clock (first, last) block start time of a recording, or None if it is empty."""
+    first = last = None
+    for segment_path in recording_paths(path):
+        entries = read_index(segment_path)
+        if entries:
+            if first is None:
+                first = entries[0][0]
+            last = entries[-1][0]
+    return None if first is None else (first, last)
+
+
+def parse_seek_time(value, first: float, last: float, slack: float = 60.0) -> float:
+    """Wall clock time (epoch seconds) for a seek request. Accepts epoch seconds, an ISO 8601 date and time,
+    or a local time of day like "14:32" / "14:32:05", taken on whichever recorded day covers it.
+    Raises ValueError if it is not within the recording (first..last, plus slack seconds)."""
+    if isinstance(value, (int, float)):
+        wall_time = float(value)
+    elif not isinstance(value, str):
+        raise ValueError(f"invalid seek time {value!r}")
+    elif value.replace(".", "", 1).isdigit():
+        wall_time = float(value)
+    elif "-" in value or "T" in value:
+        wall_time = datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    else:
+        try:
+            time_of_day = datetime.strptime(value, "%H:%M:%S" if value.count(":") == 2 else "%H:%M").time()
+        except ValueError:
+            raise ValueError(f"invalid seek time {value!r}, use HH:MM, HH:MM:SS or an ISO 8601 date and time") from None
+        day, last_day = date.fromtimestamp(first), date.fromtimestamp(last)
+        wall_time = None
+        while day <= last_day:
+            candidate = datetime.combine(day, time_of_day).timestamp()
+            if first - slack <= candidate <= last + slack:
+                wall_time = candidate
+                break
+            day += timedelta(days=1)
+        if wall_time is None:
+            raise ValueError(f"{value} is not in the recording")
+    if not first - slack <= wall_time <= last + slack:
+        raise ValueError(f"{value} is not in the recording ({datetime.fromtimestamp(first):%Y-%m-%d %H:%M:%S} "
+                         f"to {datetime.fromtimestamp(last):%Y-%m-%d %H:%M:%S})")
+    return wall_time
@@ -1,13 +1,100 @@
+import argparse
 import asyncio
 import websockets
+from websockets.extensions.permessage_deflate import PerMessageDeflate, ServerPerMessageDeflateFactory
 import json
 import signal # Standard library for signal handling
 import logging
+import struct
+import time
+import math
+import itertools
+from array import array
+from datetime import datetime
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs
+
+import adsb_recording
+
+try:
+    import numpy
+except ImportError: # Optional, see COLUMNAR_TABLE
+    numpy = None
 
 # --- Configuration ---
 EXTERNAL_WS_URI = "ws://192.87.172.71:1338"
+# Every upstream ADS-B source the relay reads at once, merged into one stream. ws:// and wss:// are WebSocket
+# feeds like EXTERNAL_WS_URI, tcp://host:port is a raw TCP feed sending one JSON message per line.
+UPSTREAM_SOURCES = [EXTERNAL_WS_URI]
+UPSTREAM_RETRY_SECONDS = 5.0 # Wait between reconnect attempts per source
+RECORDING_ENABLED = False # Append every upstream message to compressed segment files in RECORDING_DIR
+RECORDING_DIR = "recordings"
+RECORDING_SEGMENT_BYTES = 64 * 1024 * 1024 # Start a new segment file after this many bytes ..
+RECORDING_SEGMENT_SECONDS = 3600.0 # .. or this many seconds
+RECORDING_BLOCK_BYTES = 256 * 1024 # Frames are compressed in blocks of about this size ..
+RECORDING_FLUSH_SECONDS = 1.0 # .. or whatever arrived within this many seconds
+RECORDING_QUEUE_MAXSIZE = 100000 # Frames waiting for the writer thread before new ones are dropped
+RECORDING_KEYFRAME_SECONDS = 10.0 # Snapshot of the aircraft table written this often, so replays can seek without reading from the start
+REPLAY_PATH = None # Recording (segment file or directory) to serve instead of UPSTREAM_SOURCES, also --replay
+REPLAY_SPEED = 1.0 # 1 = recorded timing, 10 = ten times faster, 0 = as fast as possible, also --replay-speed
+REPLAY_LOOP = True # Start over when the recording ends
+REPLAY_MAX_GAP_SECONDS = 30.0 # Longer silences in a recording (recorder restarts, outages) are skipped
+REPLAY_YIELD_EVERY = 100 # Frames replayed back to back before clients get a turn on the event loop
+REPLAY_WAKE_SECONDS = 0.5 # Longest sleep between replayed frames, so seeks and shutdown are noticed within this
 LOCAL_WS_HOST = "0.0.0.0" # this is very dependant on if you are 'at home vs' on site 
 LOCAL_WS_PORT = 9000        # Port Unity will connect to IMPORTANTY alex ! 
+CLIENT_QUEUE_MAXSIZE = 256  # Outbound frames buffered per client before SLOW_CONSUMER_POLICY kicks in
+# What to do when a client's queue is full: "drop-oldest", "coalesce-latest" (keep newest frame per aircraft) or "disconnect"
+SLOW_CONSUMER_POLICY = "drop-oldest"
+CLIENT_MAX_LAG_SECONDS = 10.0 # "disconnect" policy: close clients whose oldest queued frame is older than this
+SLOW_CONSUMER_CLOSE_CODE = 1013 # 1013 = Try Again Later (1008 = Policy Violation also works)
+CLIENT_STATS_INTERVAL = 60.0 # Seconds between per-client queue stats log lines
+SEND_SNAPSHOT_ON_CONNECT = True # Send every tracked aircraft in one frame as soon as a client connects
+COLUMNAR_TABLE = True # Mirror the aircraft table in NumPy columns (when installed) so range, altitude and staleness filters run vectorized
+AIRCRAFT_STALE_SECONDS = 120.0 # Drop aircraft not heard from for this long (same as RadarDisplay.staleTimeThreshold)
+EVICTION_TICK_SECONDS = 1.0 # Resolution of the stale-aircraft timer wheel
+TRAIL_MAX_POINTS = 200 # Recent positions kept per aircraft for {"type": "trail"} requests, 0 = no trails
+TRAIL_MAX_TOTAL_POINTS = 200000 # Cap over all aircraft, the trails extended longest ago are dropped first
+TRAIL_SIMPLIFY_TOLERANCE_M = 50.0 # Drop trail points that lie within this distance of the line between their neighbours, 0 = keep all
+TRAIL_SIMPLIFY_ALTITUDE_FT = 100.0 # .. and within this many feet of the altitude interpolated along it
+SEND_REMOVE_EVENTS = True # Tell clients when an aircraft is dropped with a {"type": "remove"} frame
+BATCH_FLUSH_INTERVAL = 0.1 # Batching clients get one {"type": "batch"} frame per window (in line with RadarDisplay.updateRateLimit)
+BATCH_UPDATES_BY_DEFAULT = False # Clients opt in with ?batch=1 (or out with ?batch=0)
+EMIT_MIN_INTERVAL = 0.1 # Forward at most one update per aircraft per this many seconds (RadarDisplay.updateRateLimit), 0 = off
+EMIT_MIN_MOVEMENT_M = 0.0 # Once the interval passed, also skip updates that moved less than this and changed nothing else, 0 = off
+EMIT_ALTITUDE_STEP_FT = 500.0 # Altitude changes this big are always forwarded, like a new callsign
+DEAD_RECKONING = False # Only forward a position once it is DEAD_RECKONING_MAX_ERROR_M off the one clients extrapolate
+DEAD_RECKONING_MAX_ERROR_M = 100.0 # Allowed distance between the real position and the extrapolated one
+DEAD_RECKONING_HEARTBEAT_SECONDS = 10.0 # Forward every aircraft at least this often, even if it flies exactly as predicted
+DEDUP_WINDOW_SECONDS = 1.0 # Reports from a second receiver this soon after the current one only win with a newer timestamp or stronger rssi, 0 = off
+FUSION_TIME_CONSTANT = 1.0 # Seconds for an old position estimate to lose most of its weight against a new report, 0 = forward raw positions.
+                           # Only used while a second receiver has reported the aircraft within this time, one receiver is forwarded raw
+FUSION_DEFAULT_RSSI = -30.0 # Signal weight for reports without rssi
+RECEIVER_RATE_WINDOW = 10.0 # Seconds over which per-receiver message rates are measured
+EARTH_RADIUS_KM = 6371.0
+KNOTS_TO_KM_PER_SECOND = 1.852 / 3600.0
+BINARY_SUBPROTOCOL = "adsb.bin.v1" # Clients offering this WebSocket subprotocol (or connecting with ?format=bin) get binary frames
+# permessage-deflate (RFC 7692). Clients can still ask for no context takeover / smaller windows in their offer.
+COMPRESSION_ENABLED = True
+COMPRESSION_LEVEL = 6 # zlib level, 1 = fastest .. 9 = smallest
+COMPRESSION_MEM_LEVEL = 5 # zlib memLevel, 1..9, memory per client vs speed
+COMPRESSION_SERVER_MAX_WINDOW_BITS = 12 # 9..15, larger window = better ratio but more memory per client
+COMPRESSION_CLIENT_MAX_WINDOW_BITS = 12
+COMPRESSION_SERVER_NO_CONTEXT_TAKEOVER = False # True resets the compressor every message: less memory, much worse ratio
+COMPRESSION_CLIENT_NO_CONTEXT_TAKEOVER = False
+GEOFENCE_GRID_DEGREES = 1.0 # Cell size of the lat/lon grid used to find the geofences an aircraft is in
+GEOFENCE_MAX_CELLS = 400 # Geofences spanning more cells than this are checked on every update instead
+
+SLOW_CONSUMER_POLICIES = ("drop-oldest", "coalesce-latest", "disconnect")
+# Fields of an upstream ADS-B message kept in the aircraft table (same names as PlaneData.cs)
+AIRCRAFT_FIELDS = ("latitude", "longitude", "altitude", "speed", "heading", "callsign", "rssi", "receiver", "timestamp")
+# Fields that change on every report and alone do not make an update worth forwarding
+BOOKKEEPING_FIELDS = ("rssi", "receiver", "timestamp")
+# Fields that must be finite numbers (numeric strings are converted) and, if listed, within these bounds
+NUMERIC_FIELDS = {"latitude": (-90.0, 90.0), "longitude": (-180.0, 180.0),
+                  "altitude": (-2000.0, 130000.0), # feet, a little beyond what ADS-B can encode
+                  "speed": None, "heading": None, "rssi": None}
+TEXT_FIELDS = ("address", "callsign", "receiver")
 
 # --- Logging Setup ---
 logging.basicConfig(
@@ -19,9 +106,1111 @@ ws_logger = logging.getLogger('websockets') # Get the logger for the websockets
 ws_logger.setLevel(logging.WARNING) # Set websockets library logging to WARNING to reduce noise
 
 # --- Store connected clients (Unity instances) ---
-CONNECTED_CLIENTS = set()
+CONNECTED_CLIENTS = {} # websocket -> ClientSession
 # --- Global shutdown event ---
 shutdown_event = asyncio.Event()
+RECORDER = None # adsb_recording.Recorder while RECORDING_ENABLED
+replay_seek_event = asyncio.Event() # Set when a client asks the replay to jump to replay_seek_time
+replay_seek_time = None # Wall clock time (epoch seconds) to replay from
+replay_clock = None # ReplayClock while replaying, see relay_time
+
+
+class TimerWheel:
+    """Hashed timing wheel. Scheduling is O(1) and each tick only visits the keys filed under one slot."""
+
+    def __init__(self, tick_seconds: float, horizon_seconds: float):
+        self.tick_seconds = tick_seconds
+        self.slots = [set() for _ in range(int(math.ceil(horizon_seconds / tick_seconds)) + 1)]
+        self.last_tick = None # Absolute tick number processed by the last advance()
+
+    def schedule(self, key, when: float):
+        """Files key under the slot for time `when`. Deadlines past the horizon come up early and get rescheduled."""
+        tick = int(when // self.tick_seconds)
+        if self.last_tick is not None and tick <= self.last_tick:
+            tick = self.last_tick + 1
+        self.slots[tick % len(self.slots)].add(key)
+
+    def advance(self, now: float) -> list:
+        """Returns every key whose slot came due since the previous call, removing them from the wheel."""
+        now_tick = int(now // self.tick_seconds)
+        if self.last_tick is None:
+            self.last_tick = now_tick - 1
+        first_tick = max(self.last_tick + 1, now_tick - len(self.slots) + 1) # Never spin more than one revolution
+        due = []
+        for tick in range(first_tick, now_tick + 1):
+            slot = self.slots[tick % len(self.slots)]
+            if slot:
+                due.extend(slot)
+                slot.clear()
+        self.last_tick = max(self.last_tick, now_tick)
+        return due
+
+
+class AircraftState:
+    """Latest known value of every field for one aircraft, with the time each field was last reported."""
+    __slots__ = ("address", "fields", "field_times", "last_seen", "emitted_fields", "emitted_at", "emitted_velocity",
+                 "fused_latitude", "fused_longitude", "fused_at", "fused_weight", "fused_receiver", "other_receiver_at")
+
+    def __init__(self, address: str):
+        self.address = address
+        self.fields = {}      # field name -> latest non-null value
+        self.field_times = {} # field name -> relay_time() of the last report carrying it
+        self.last_seen = 0.0
+        self.emitted_fields = None # Copy of fields when an update was last forwarded to clients (see should_emit)
+        self.emitted_at = 0.0
+        self.emitted_velocity = None # (degrees latitude, degrees longitude) per second between the last two forwarded positions
+        self.fused_latitude = None # Position estimate fused from every receiver (see fuse_position)
+        self.fused_longitude = None
+        self.fused_at = 0.0
+        self.fused_weight = 0.0
+        self.fused_receiver = None # Receiver of the last position report, to tell when a second one joins
+        self.other_receiver_at = None # relay_time() when the reporting receiver last changed
+
+    def merge(self, record: dict, now: float) -> list:
+        """Merges the non-null fields of an upstream record. Returns the names of fields whose value changed."""
+        changed = []
+        fields = self.fields
+        for name in AIRCRAFT_FIELDS:
+            value = record.get(name)
+            if value is None:
+                continue
+            if fields.get(name) != value:
+                fields[name] = value
+                changed.append(name)
+            self.field_times[name] = now
+        self.last_seen = now
+        return changed
+
+    def to_dict(self) -> dict:
+        """Plain dict in the same shape as an upstream message."""
+        data = {"address": self.address}
+        data.update(self.fields)
+        return data
+
+
+def _column_value(value) -> float:
+    """A field value as stored in AircraftColumns, NaN if unknown or not a number."""
+    if value is None:
+        return math.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class AircraftColumns:
+    """NumPy mirror of the numeric fields of AircraftTable, one row per aircraft, so filters over every aircraft
+    run as a few array operations instead of a Python loop. NaN marks unknown values; free rows have no last_seen."""
+    COLUMNS = ("latitude", "longitude", "altitude", "speed", "heading") # Followed by last_seen
+    INDEX = {name: index for index, name in enumerate(COLUMNS + ("last_seen",))}
+
+    def __init__(self, capacity: int = 1024):
+        self.rows = {} # address -> row
+        self.addresses = [None] * capacity # row -> address
+        self.free = list(range(capacity - 1, -1, -1)) # Popped from the end, so low rows are used first
+        self.data = numpy.full((capacity, len(self.COLUMNS) + 1), numpy.nan)
+
+    def column(self, name: str):
+        """View of one column, name one of COLUMNS or "last_seen"."""
+        return self.data[:, self.INDEX[name]]
+
+    def _grow(self):
+        capacity = len(self.addresses)
+        self.data = numpy.concatenate((self.data, numpy.full_like(self.data, numpy.nan)))
+        self.addresses.extend([None] * capacity)
+        self.free.extend(range(2 * capacity - 1, capacity - 1, -1))
+
+    def store(self, state, changed: list = None):
+        """Copies state into its row. For an aircraft already stored, only the changed fields are rewritten."""
+        fields = state.fields
+        data = self.data
+        row = self.rows.get(state.address)
+        if row is None:
+            if not self.free:
+                self._grow()
+                data = self.data
+            row = self.rows[state.address] = self.free.pop()
+            self.addresses[row] = state.address
+            changed = self.COLUMNS
+        elif changed is None:
+            changed = self.COLUMNS
+        index = self.INDEX
+        for name in changed:
+            column = index.get(name)
+            if column is not None:
+                data[row, column] = _column_value(fields.get(name))
+        data[row, -1] = state.last_seen
+
+    def touch(self, address: str, now: float):
+        row = self.rows.get(address)
+        if row is not None:
+            self.data[row, -1] = now
+
+    def discard(self, address: str):
+        row = self.rows.pop(address, None)
+        if row is None:
+            return
+        self.data[row] = numpy.nan
+        self.addresses[row] = None
+        self.free.append(row)
+
+    def clear(self):
+        self.rows.clear()
+        self.addresses = [None] * len(self.addresses)
+        self.free = list(range(len(self.addresses) - 1, -1, -1))
+        self.data.fill(numpy.nan)
+
+    def select(self, geofence=None, min_altitude: float = None, max_altitude: float = None, min_last_seen: float = None) -> list:
+        """Addresses passing every given filter, see AircraftTable.select."""
+        altitude = self.column("altitude")
+        last_seen = self.column("last_seen")
+        unknown_altitude = numpy.isnan(altitude)
+        mask = ~numpy.isnan(last_seen) # Rows in use
+        if geofence is not None:
+            latitude = numpy.radians(self.column("latitude"))
+            center_latitude = math.radians(geofence.latitude)
+            a = numpy.sin((latitude - center_latitude) / 2) ** 2 + math.cos(center_latitude) * numpy.cos(latitude) * \
+                numpy.sin(numpy.radians(self.column("longitude") - geofence.longitude) / 2) ** 2
+            with numpy.errstate(invalid="ignore"): # NaN rows (no position) just compare False
+                mask &= 2 * EARTH_RADIUS_KM * numpy.arcsin(numpy.minimum(1.0, numpy.sqrt(a))) <= geofence.radius_km
+            if geofence.min_altitude is not None:
+                mask &= unknown_altitude | (altitude >= geofence.min_altitude)
+            if geofence.max_altitude is not None:
+                mask &= unknown_altitude | (altitude <= geofence.max_altitude)
+        if min_altitude is not None:
+            mask &= unknown_altitude | (altitude >= min_altitude)
+        if max_altitude is not None:
+            mask &= unknown_altitude | (altitude <= max_altitude)
+        if min_last_seen is not None:
+            mask &= last_seen >= min_last_seen
+        addresses = self.addresses
+        return [addresses[row] for row in numpy.flatnonzero(mask).tolist()]
+
+
+class AircraftTable:
+    """In-memory state of every tracked aircraft, keyed by ICAO address.
+    With COLUMNAR_TABLE and NumPy installed, the numeric fields are mirrored in AircraftColumns for select()."""
+
+    def __init__(self, stale_seconds: float = AIRCRAFT_STALE_SECONDS, columnar: bool = COLUMNAR_TABLE):
+        self.aircraft = {} # address -> AircraftState
+        self.version = 0 # Bumped on every change, so cached snapshots know when they are out of date
+        self.stale_seconds = stale_seconds
+        self._expiry_wheel = TimerWheel(EVICTION_TICK_SECONDS, stale_seconds)
+        self.columns = AircraftColumns() if columnar and numpy is not None else None
+
+    def __len__(self):
+        return len(self.aircraft)
+
+    def get(self, address: str):
+        return self.aircraft.get(address)
+
+    def update(self, record: dict, now: float = None):
+        """Merges one upstream record. Returns (state, changed field names), or (None, []) without an address."""
+        address = record.get("address")
+        if not address:
+            return None, []
+        if now is None:
+            now = relay_time()
+        state = self.aircraft.get(address)
+        if state is None:
+            state = self.aircraft[address] = AircraftState(address)
+            self._expiry_wheel.schedule(address, now + self.stale_seconds)
+        self.version += 1
+        changed = state.merge(record, now)
+        if self.columns is not None:
+            self.columns.store(state, changed)
+        return state, changed
+
+    def touch(self, state: AircraftState, now: float):
+        """Marks an aircraft as heard without changing any field."""
+        state.last_seen = now
+        if self.columns is not None:
+            self.columns.touch(state.address, now)
+
+    def clear(self):
+        """Forgets every aircraft, e.g. when a replay jumps to another time. The expiry wheel skips the ones it still holds."""
+        self.version += 1
+        self.aircraft.clear()
+        if self.columns is not None:
+            self.columns.clear()
+
+    def expire(self, now: float = None) -> list:
+        """Removes aircraft not seen for stale_seconds and returns their states.
+        Updates never touch the wheel; an aircraft seen since it was filed is just rescheduled when its slot comes up."""
+        if now is None:
+            now = relay_time()
+        expired = []
+        for address in self._expiry_wheel.advance(now):
+            state = self.aircraft.get(address)
+            if state is None:
+                continue # Already removed
+            deadline = state.last_seen + self.stale_seconds
+            if deadline <= now:
+                del self.aircraft[address]
+                if self.columns is not None:
+                    self.columns.discard(address)
+                self.version += 1
+                expired.append(state)
+            else:
+                self._expiry_wheel.schedule(address, deadline)
+        return expired
+
+    def states(self):
+        return list(self.aircraft.values())
+
+    def select(self, geofence=None, min_altitude: float = None, max_altitude: float = None, max_age: float = None,
+               now: float = None) -> list:
+        """States of the aircraft inside geofence, within [min_altitude, max_altitude] feet (unknown altitudes pass,
+        as in Geofence) and heard within max_age seconds; filters left at None are not applied."""
+        min_last_seen = None
+        if max_age is not None:
+            min_last_seen = (relay_time() if now is None else now) - max_age
+        if self.columns is not None:
+            aircraft = self.aircraft
+            return [aircraft[address] for address in self.columns.select(geofence, min_altitude, max_altitude, min_last_seen)]
+        selected = []
+        for state in self.aircraft.values():
+            if geofence is not None and not geofence.contains(state):
+                continue
+            altitude = state.fields.get("altitude")
+            if altitude is not None and ((min_altitude is not None and altitude < min_altitude) or
+                                         (max_altitude is not None and altitude > max_altitude)):
+                continue
+            if min_last_seen is not None and state.last_seen < min_last_seen:
+                continue
+            selected.append(state)
+        return selected
+
+
+TRAIL_STRIDE = 4 # latitude, longitude, altitude (NaN if unknown), wall clock time
+
+
+class Trail:
+    """Ring buffer of an aircraft's recent positions, TRAIL_STRIDE floats per point in one flat array.
+    Points are simplified as they arrive (see append): the last point is "floating" and gets replaced by the next
+    one as long as the line from the last kept point (the anchor) to the new point passes within
+    TRAIL_SIMPLIFY_TOLERANCE_M / TRAIL_SIMPLIFY_ALTITUDE_FT of every point dropped since the anchor. That is checked
+    in constant time by narrowing a cone of allowed bearings and a range of allowed climb slopes from the anchor."""
+    __slots__ = ("points", "head", "capacity", "anchor_latitude", "anchor_longitude", "anchor_altitude",
+                 "reference", "low", "high", "slope_low", "slope_high", "reach")
+
+    def __init__(self, capacity: int):
+        self.points = array("d")
+        self.head = 0 # Point to overwrite next once full, i.e. the oldest one
+        self.capacity = capacity
+        self.anchor_latitude = None # Last kept point before the floating one, None while there is no floating point
+        self.anchor_longitude = 0.0
+        self.anchor_altitude = 0.0
+        self.reference = None # Bearing the cone is measured from, None while every point is within tolerance of the anchor
+        self.low = self.high = 0.0 # Allowed bearings from the anchor, in radians from reference
+        self.slope_low = -math.inf # Allowed altitude change per meter from the anchor
+        self.slope_high = math.inf
+        self.reach = 0.0 # Furthest distance from the anchor of a point since it
+
+    def __len__(self):
+        return len(self.points) // TRAIL_STRIDE
+
+    def append(self, latitude: float, longitude: float, altitude, at: float) -> int:
+        """Adds a position, replacing the floating point if that stays within tolerance, otherwise keeping it
+        and overwriting the oldest point when full. Returns the number of points added (0 or 1)."""
+        if altitude is None:
+            altitude = math.nan
+        if self.anchor_latitude is not None and TRAIL_SIMPLIFY_TOLERANCE_M > 0:
+            distance, bearing = self._measure(latitude, longitude)
+            if self._fits(distance, bearing, altitude):
+                self._narrow(distance, bearing, altitude)
+                self._write(self._last_index(), latitude, longitude, altitude, at)
+                return 0
+        added = 0
+        if len(self) < self.capacity:
+            self.points.extend((latitude, longitude, altitude, at))
+            added = 1
+        else:
+            self._write(self.head * TRAIL_STRIDE, latitude, longitude, altitude, at)
+            self.head = (self.head + 1) % self.capacity
+        if len(self) > 1 and TRAIL_SIMPLIFY_TOLERANCE_M > 0: # The previous point is kept from now on and anchors the new floating one
+            index = (self._last_index() - TRAIL_STRIDE) % len(self.points)
+            self._start_cone(self.points[index], self.points[index + 1], self.points[index + 2])
+            self._narrow(*self._measure(latitude, longitude), altitude)
+        return added
+
+    def _last_index(self) -> int:
+        return ((self.head - 1) % len(self) if len(self) == self.capacity else len(self) - 1) * TRAIL_STRIDE
+
+    def _write(self, index: int, latitude: float, longitude: float, altitude: float, at: float):
+        points = self.points
+        points[index] = latitude
+        points[index + 1] = longitude
+        points[index + 2] = altitude
+        points[index + 3] = at
+
+    def _start_cone(self, latitude: float, longitude: float, altitude: float):
+        self.anchor_latitude = latitude
+        self.anchor_longitude = longitude
+        self.anchor_altitude = altitude
+        self.reference = None
+        self.slope_low = -math.inf
+        self.slope_high = math.inf
+        self.reach = 0.0
+
+    def _measure(self, latitude: float, longitude: float):
+        """Distance (m) and bearing (radians) from the anchor, flat earth as on the radar."""
+        north = (latitude - self.anchor_latitude) * 111133.0
+        east = (longitude - self.anchor_longitude) * 111320.0 * math.cos(math.radians(self.anchor_latitude))
+        return math.hypot(north, east), math.atan2(east, north)
+
+    def _fits(self, distance: float, bearing: float, altitude: float) -> bool:
+        """True if the line from the anchor to this point passes within tolerance of every point since the anchor."""
+        if distance < self.reach - TRAIL_SIMPLIFY_TOLERANCE_M:
+            return False # Turned back, the dropped points would stick out past the end of the line
+        if distance <= TRAIL_SIMPLIFY_TOLERANCE_M:
+            if self.reference is not None:
+                return False # Back near the anchor after having left it
+        elif self.reference is not None:
+            offset = (bearing - self.reference + math.pi) % (2 * math.pi) - math.pi
+            if not self.low <= offset <= self.high:
+                return False
+        if math.isnan(altitude) or math.isnan(self.anchor_altitude):
+            return math.isnan(altitude) == math.isnan(self.anchor_altitude) # Keep the point where the altitude appears or goes
+        return self.slope_low <= (altitude - self.anchor_altitude) / max(distance, 1.0) <= self.slope_high
+
+    def _narrow(self, distance: float, bearing: float, altitude: float):
+        """Limits the cone and slope range so later lines also pass within tolerance of this point."""
+        if distance > TRAIL_SIMPLIFY_TOLERANCE_M:
+            spread = math.asin(TRAIL_SIMPLIFY_TOLERANCE_M / distance)
+            if self.reference is None:
+                self.reference, self.low, self.high = bearing, -spread, spread
+            else:
+                offset = (bearing - self.reference + math.pi) % (2 * math.pi) - math.pi
+                self.low = max(self.low, offset - spread)
+                self.high = min(self.high, offset + spread)
+        if not math.isnan(altitude) and not math.isnan(self.anchor_altitude):
+            run = max(distance, 1.0)
+            slope = (altitude - self.anchor_altitude) / run
+            self.slope_low = max(self.slope_low, slope - TRAIL_SIMPLIFY_ALTITUDE_FT / run)
+            self.slope_high = min(self.slope_high, slope + TRAIL_SIMPLIFY_ALTITUDE_FT / run)
+        self.reach = max(self.reach, distance)
+
+    def to_list(self) -> list:
+        """Points oldest first as [latitude, longitude, altitude or None, time] lists."""
+        points = self.points
+        count = len(self)
+        ordered = []
+        for number in range(count):
+            index = (self.head + number) % count * TRAIL_STRIDE
+            altitude = points[index + 2]
+            ordered.append([points[index], points[index + 1], None if math.isnan(altitude) else altitude, points[index + 3]])
+        return ordered
+
+
+class TrailStore:
+    """Recent positions of every tracked aircraft, bounded per aircraft and in total."""
+
+    def __init__(self, max_points: int = TRAIL_MAX_POINTS, max_total_points: int = TRAIL_MAX_TOTAL_POINTS):
+        self.trails = OrderedDict() # address -> Trail, least recently extended first
+        self.total_points = 0
+        self.max_points = max_points
+        self.max_total_points = max_total_points
+
+    def __len__(self):
+        return len(self.trails)
+
+    def get(self, address: str):
+        return self.trails.get(address)
+
+    def add(self, address: str, latitude: float, longitude: float, altitude, at: float):
+        trail = self.trails.get(address)
+        if trail is None:
+            trail = self.trails[address] = Trail(self.max_points)
+        else:
+            self.trails.move_to_end(address)
+        self.total_points += trail.append(latitude, longitude, altitude, at)
+        while self.total_points > self.max_total_points and len(self.trails) > 1:
+            _, dropped = self.trails.popitem(last=False)
+            self.total_points -= len(dropped)
+
+    def forget(self, address: str):
+        trail = self.trails.pop(address, None)
+        if trail is not None:
+            self.total_points -= len(trail)
+
+    def clear(self):
+        self.trails.clear()
+        self.total_points = 0
+
+
+# --- Server-side aircraft state, filled from the upstream feed ---
+AIRCRAFT_TABLE = AircraftTable()
+TRAILS = TrailStore()
+# --- Relay-wide counters, logged with the client stats ---
+RECEIVER_STATS = {} # receiver name -> ReceiverStats
+HELD_UPDATES = {} # address -> AircraftState whose latest update the rate limit held back, see release_held_updates
+RELAY_STATS = {"received": 0, "rate_limited": 0, "deduplicated": 0, "invalid": 0, "encoded": 0, "encode_reused": 0}
+
+
+class EncodeCache:
+    """Serializes each distinct payload once per fan-out, so every client it goes to shares the same str/bytes object.
+    Keys name the format and whatever decides the content (aircraft, changed fields, filter group)."""
+
+    def __init__(self):
+        self._payloads = {}
+        self.generation = None # What the cached payloads were built from, see reset_for()
+
+    def clear(self):
+        self._payloads.clear()
+
+    def reset_for(self, generation):
+        """Drops everything if the cache was filled for a different generation (e.g. aircraft table version)."""
+        if generation != self.generation:
+            self._payloads.clear()
+            self.generation = generation
+
+    def get(self, key, encode, *args):
+        """Returns the cached payload for key, calling encode(*args) the first time."""
+        try:
+            payload = self._payloads[key]
+        except KeyError:
+            payload = self._payloads[key] = encode(*args)
+            RELAY_STATS["encoded"] += 1
+            return payload
+        RELAY_STATS["encode_reused"] += 1
+        return payload
+
+
+ENCODE_CACHE = EncodeCache()   # Cleared at the start of every broadcast, batch flush and removal
+SNAPSHOT_CACHE = EncodeCache() # Full-table snapshots, valid until the aircraft table changes
+
+
+class OutboundQueue:
+    """Bounded FIFO of outbound frames that applies the slow-consumer policy when it fills up."""
+
+    def __init__(self, maxsize: int, policy: str):
+        self.maxsize = maxsize
+        self.policy = policy
+        self._items = OrderedDict() # key -> (enqueued_at, message, seq). Key is the aircraft address when coalescing
+        self._seq = itertools.count()
+        self._barrier = -1 # seq of the last keyless frame; updates queued before it must not be overtaken by it
+        self._ready = asyncio.Event()
+        self.dropped_count = 0
+        self.coalesced_count = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def oldest_age(self, now: float) -> float:
+        """Seconds the oldest queued frame has been waiting."""
+        if not self._items:
+            return 0.0
+        enqueued_at, _, _ = next(iter(self._items.values()))
+        return now - enqueued_at
+
+    def put(self, message, key=None) -> bool:
+        """Queues a frame without waiting. Returns False when the "disconnect" policy refuses it."""
+        seq = next(self._seq)
+        if self.policy == "coalesce-latest" and key is not None:
+            queued = self._items.get(key)
+            if queued is not None: # Newer update for an aircraft still waiting: replace it
+                self.coalesced_count += 1
+                if queued[2] > self._barrier: # Nothing else queued behind it that it could be reordered with
+                    self._items[key] = (queued[0], message, queued[2])
+                    return True
+                # A snapshot or removal was queued after the old update (it may remove this aircraft), so the
+                # newer update goes behind it instead of jumping ahead
+                del self._items[key]
+                self._items[key] = (time.monotonic(), message, seq)
+                return True
+        else:
+            key = seq
+            self._barrier = seq
+
+        if len(self._items) >= self.maxsize:
+            if self.policy == "disconnect":
+                return False
+            self._items.popitem(last=False)
+            self.dropped_count += 1
+
+        self._items[key] = (time.monotonic(), message, seq)
+        self._ready.set()
+        return True
+
+    async def get(self):
+        """Waits for and returns the oldest queued frame."""
+        while not self._items:
+            self._ready.clear()
+            await self._ready.wait()
+        _, (_, message, _) = self._items.popitem(last=False)
+        return message
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle (haversine) distance between two points in kilometers."""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    a = math.sin((phi2 - phi1) / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def predict_position(latitude: float, longitude: float, speed, heading, seconds: float):
+    """Where an aircraft at latitude/longitude flying speed knots on heading degrees is after seconds (flat earth,
+    fine for the few seconds between reports). Without speed or heading it stays put."""
+    if speed is None or heading is None or seconds <= 0:
+        return latitude, longitude
+    distance = speed * KNOTS_TO_KM_PER_SECOND * seconds
+    track = math.radians(heading)
+    latitude_step = math.degrees(distance * math.cos(track) / EARTH_RADIUS_KM)
+    longitude_step = math.degrees(distance * math.sin(track) / (EARTH_RADIUS_KM * max(0.01, math.cos(math.radians(latitude)))))
+    return latitude + latitude_step, longitude + longitude_step
+
+
+class ReceiverStats:
+    """Message rate, signal strength and coverage of one upstream receiver, keyed by the records' receiver field."""
+    __slots__ = ("receiver", "messages", "rssi_total", "rssi_count", "aircraft", "last_seen", "rate",
+                 "window_start", "window_messages")
+
+    def __init__(self, receiver: str, now: float):
+        self.receiver = receiver
+        self.messages = 0
+        self.rssi_total = 0.0
+        self.rssi_count = 0
+        self.aircraft = {} # address -> relay_time() it was last heard by this receiver
+        self.last_seen = now
+        self.rate = 0.0 # Messages per second over the last full RECEIVER_RATE_WINDOW
+        self.window_start = now
+        self.window_messages = 0
+
+    def note(self, address: str, rssi, now: float):
+        self.messages += 1
+        if rssi is not None:
+            self.rssi_total += rssi
+            self.rssi_count += 1
+        self.aircraft[address] = now
+        self.last_seen = now
+        self.window_messages += 1
+        elapsed = now - self.window_start
+        if elapsed >= RECEIVER_RATE_WINDOW:
+            self.rate = self.window_messages / elapsed
+            self.window_start = now
+            self.window_messages = 0
+
+    def summary(self, now: float) -> dict:
+        """Counters for logging and {"type": "receiver_stats"} replies. Forgets aircraft it no longer hears."""
+        for address, heard in list(self.aircraft.items()):
+            if now - heard >= AIRCRAFT_STALE_SECONDS:
+                del self.aircraft[address]
+        return {
+            "receiver": self.receiver,
+            "messages": self.messages,
+            "rate": round(self.rate if now - self.window_start < 2 * RECEIVER_RATE_WINDOW else 0.0, 2),
+            "mean_rssi": round(self.rssi_total / self.rssi_count, 1) if self.rssi_count else None,
+            "aircraft": len(self.aircraft),
+            "last_seen_seconds": round(now - self.last_seen, 1),
+        }
+
+
+def note_receiver(record: dict, now: float):
+    """Counts one upstream record towards the stats of the receiver that heard it."""
+    receiver = record.get("receiver")
+    if receiver is None:
+        return
+    stats = RECEIVER_STATS.get(receiver)
+    if stats is None:
+        stats = RECEIVER_STATS[receiver] = ReceiverStats(receiver, now)
+    stats.note(record.get("address"), record.get("rssi"), now)
+
+
+def receiver_summaries(now: float = None) -> list:
+    if now is None:
+        now = relay_time()
+    return [stats.summary(now) for stats in RECEIVER_STATS.values()]
+
+
+def signal_weight(rssi) -> float:
+    """Linear amplitude of an rssi in dB, so a receiver 6 dB stronger counts about twice as much."""
+    return 10.0 ** ((FUSION_DEFAULT_RSSI if rssi is None else min(rssi, 0.0)) / 20.0)
+
+
+def fuse_position(state: AircraftState, record: dict, now: float):
+    """Folds a reported position into the aircraft's fused track and returns the fused (latitude, longitude).
+    The previous estimate is carried forward along speed/heading, its weight decays with age over
+    FUSION_TIME_CONSTANT and the report is weighted by signal_weight, so fresh and strong reports dominate.
+    Unless another receiver reported within FUSION_TIME_CONSTANT, the report is taken as is: blending a single
+    receiver with its own past only makes the track lag and cut turns."""
+    latitude, longitude = record.get("latitude"), record.get("longitude")
+    weight = signal_weight(record.get("rssi"))
+    receiver = record.get("receiver")
+    if state.fused_receiver is not None and receiver != state.fused_receiver:
+        state.other_receiver_at = now
+    state.fused_receiver = receiver
+    if state.fused_latitude is None or state.other_receiver_at is None or now - state.other_receiver_at > FUSION_TIME_CONSTANT:
+        state.fused_latitude, state.fused_longitude = latitude, longitude
+    else:
+        elapsed = now - state.fused_at
+        fields = state.fields
+        predicted_latitude, predicted_longitude = predict_position(
+            state.fused_latitude, state.fused_longitude, fields.get("speed"), fields.get("heading"), elapsed)
+        prior = state.fused_weight * math.exp(-elapsed / FUSION_TIME_CONSTANT)
+        total = prior + weight
+        state.fused_latitude = (prior * predicted_latitude + weight * latitude) / total
+        state.fused_longitude = (prior * predicted_longitude + weight * longitude) / total
+        weight = total
+    state.fused_at = now
+    state.fused_weight = weight
+    return state.fused_latitude, state.fused_longitude
+
+
+class Geofence:
+    """Circle around a client's location, optionally limited to an altitude band (feet)."""
+    __slots__ = ("latitude", "longitude", "radius_km", "min_altitude", "max_altitude")
+
+    def __init__(self, latitude: float, longitude: float, radius_km: float, min_altitude: float = None, max_altitude: float = None):
+        if not -90.0 <= latitude <= 90.0 or not -180.0 <= longitude <= 180.0: # Also rejects NaN
+            raise ValueError(f"invalid center {latitude}, {longitude}")
+        if not math.isfinite(radius_km) or radius_km <= 0:
+            raise ValueError(f"radius_km must be a positive number, got {radius_km}")
+        for altitude in (min_altitude, max_altitude):
+            if altitude is not None and not math.isfinite(altitude):
+                raise ValueError(f"altitude limits must be numbers, got {altitude}")
+        self.latitude = latitude
+        self.longitude = longitude
+        self.radius_km = radius_km
+        self.min_altitude = min_altitude
+        self.max_altitude = max_altitude
+
+    @classmethod
+    def from_message(cls, message: dict):
+        """Builds a geofence from a client {"type": "subscribe"} message. Raises ValueError if it is malformed."""
+        try:
+            min_altitude = message.get("min_altitude")
+            max_altitude = message.get("max_altitude")
+            return cls(
+                float(message["latitude"]),
+                float(message["longitude"]),
+                float(message["radius_km"]),
+                float(min_altitude) if min_altitude is not None else None,
+                float(max_altitude) if max_altitude is not None else None,
+            )
+        except (KeyError, TypeError, OverflowError) as e:
+            raise ValueError(f"subscribe needs latitude, longitude and radius_km ({e})")
+
+    def contains(self, state) -> bool:
+        """True if the aircraft's last known position is inside. Aircraft without a position are outside."""
+        fields = state.fields
+        latitude = fields.get("latitude")
+        longitude = fields.get("longitude")
+        if latitude is None or longitude is None:
+            return False
+        altitude = fields.get("altitude")
+        if altitude is not None:
+            if self.min_altitude is not None and altitude < self.min_altitude:
+                return False
+            if self.max_altitude is not None and altitude > self.max_altitude:
+                return False
+        return distance_km(self.latitude, self.longitude, latitude, longitude) <= self.radius_km
+
+    def __repr__(self):
+        return f"Geofence({self.latitude}, {self.longitude}, {self.radius_km}km, alt {self.min_altitude}-{self.max_altitude})"
+
+
+class GeofenceIndex:
+    """Lat/lon grid mapping each cell to the geofenced clients whose circle overlaps it,
+    so an aircraft update finds its subscribers with one cell lookup instead of checking every client."""
+
+    def __init__(self, cell_degrees: float = GEOFENCE_GRID_DEGREES):
+        self.cell_degrees = cell_degrees
+        self.rows = int(math.ceil(180.0 / cell_degrees))
+        self.columns = int(math.ceil(360.0 / cell_degrees))
+        self.unfenced = set() # Sessions without a geofence, they get every aircraft
+        self.wide = set()     # Geofenced sessions too big to index, checked on every update
+        self.cells = {}       # (row, column) -> sessions whose geofence overlaps the cell
+        self.session_cells = {} # session -> cells it is filed under
+        self.viewers = {}     # address -> geofenced sessions that were last sent the aircraft as inside
+
+    def _row(self, latitude: float) -> int:
+        return min(self.rows - 1, max(0, int((latitude + 90.0) // self.cell_degrees)))
+
+    def _column(self, longitude: float) -> int:
+        return int((longitude + 180.0) // self.cell_degrees) % self.columns
+
+    def _cells_for(self, geofence: Geofence):
+        """Cells overlapping the geofence's bounding box, or None if there are more than GEOFENCE_MAX_CELLS."""
+        lat_margin = math.degrees(geofence.radius_km / EARTH_RADIUS_KM)
+        south = geofence.latitude - lat_margin
+        north = geofence.latitude + lat_margin
+        if south <= -90.0 or north >= 90.0:
+            columns = range(self.columns) # Circle reaches a pole: every longitude is in range
+        else:
+            lon_margin = lat_margin / math.cos(math.radians(max(abs(south), abs(north))))
+            if lon_margin >= 180.0:
+                columns = range(self.columns)
+            else:
+                first = int((geofence.longitude - lon_margin + 180.0) // self.cell_degrees)
+                last = int((geofence.longitude + lon_margin + 180.0) // self.cell_degrees)
+                columns = [column % self.columns for column in range(first, min(last, first + self.columns - 1) + 1)]
+        rows = range(self._row(south), self._row(north) + 1)
+        if len(rows) * len(columns) > GEOFENCE_MAX_CELLS:
+            return None
+        return [(row, column) for row in rows for column in columns]
+
+    def add(self, session):
+        """Registers a newly connected session, initially without a geofence."""
+        self.unfenced.add(session)
+
+    def discard(self, session):
+        """Forgets a session entirely (client disconnected)."""
+        self.unfenced.discard(session)
+        self._unfile(session)
+
+    def subscribe(self, session, geofence: Geofence, visible_addresses):
+        """Files the session under the cells its geofence overlaps. visible_addresses are the aircraft
+        the client was just sent as inside, so it can be told when they leave."""
+        cells = self._cells_for(geofence) # Before touching the index, so a failure leaves the session as it was
+        self.unfenced.discard(session)
+        self._unfile(session)
+        session.geofence = geofence
+        if cells is None:
+            self.wide.add(session)
+        else:
+            for cell in cells:
+                self.cells.setdefault(cell, set()).add(session)
+            self.session_cells[session] = cells
+        for address in visible_addresses:
+            self.viewers.setdefault(address, set()).add(session)
+
+    def unsubscribe(self, session):
+        """Drops the session's geofence so it gets every aircraft again."""
+        self._unfile(session)
+        session.geofence = None
+        self.unfenced.add(session)
+
+    def _unfile(self, session):
+        self.wide.discard(session)
+        for cell in self.session_cells.pop(session, ()):
+            sessions = self.cells.get(cell)
+            if sessions is not None:
+                sessions.discard(session)
+                if not sessions:
+                    del self.cells[cell]
+        if session.geofence is not None:
+            for address in [address for address, sessions in self.viewers.items() if session in sessions]:
+                self.forget_viewer(address, session)
+
+    def forget_viewer(self, address: str, session):
+        sessions = self.viewers.get(address)
+        if sessions is not None:
+            sessions.discard(session)
+            if not sessions:
+                del self.viewers[address]
+
+    def route(self, state):
+        """Returns (sessions the aircraft is inside the geofence of, sessions it just left)."""
+        fields = state.fields
+        latitude = fields.get("latitude")
+        longitude = fields.get("longitude")
+        candidates = self.wide
+        if latitude is not None and longitude is not None:
+            cell_sessions = self.cells.get((self._row(latitude), self._column(longitude)))
+            if cell_sessions:
+                candidates = cell_sessions.union(self.wide) if self.wide else cell_sessions
+        inside = [session for session in candidates if session.geofence.contains(state)]
+
+        previous = self.viewers.get(state.address)
+        if inside:
+            current = set(inside)
+            self.viewers[state.address] = current
+            left = previous - current if previous else ()
+        else:
+            left = self.viewers.pop(state.address, ())
+        return inside, left
+
+    def forget(self, address: str):
+        """Forgets an aircraft that is no longer tracked. Returns the geofenced sessions that had it on screen."""
+        return self.viewers.pop(address, ())
+
+
+GEOFENCE_INDEX = GeofenceIndex()
+
+
+# --- Binary wire format (adsb.bin.v1) ---
+# Every binary frame starts with a <BBH header: format version, frame type, record count (little-endian).
+# Update/snapshot/batch records are a fixed 20-byte <3sBiiiHH struct: 24-bit ICAO address (big-endian),
+# presence flags, latitude and longitude in 1e-7 degrees, altitude in feet, speed in 0.1 knots and
+# heading in 0.01 degrees, followed by an 8-byte space-padded callsign when BINARY_FLAG_CALLSIGN is set.
+# Fields whose flag is clear are zero (delta mode uses this for unchanged fields). Remove records are
+# just the 3-byte address. rssi, receiver and timestamp are only available in JSON.
+BINARY_VERSION = 1
+BINARY_FRAME_UPDATE, BINARY_FRAME_SNAPSHOT, BINARY_FRAME_BATCH, BINARY_FRAME_REMOVE = 1, 2, 3, 4
+BINARY_FLAG_POSITION, BINARY_FLAG_ALTITUDE, BINARY_FLAG_SPEED, BINARY_FLAG_HEADING, BINARY_FLAG_CALLSIGN = 1, 2, 4, 8, 16
+BINARY_MAX_RECORDS = 0xFFFF
+_BINARY_HEADER = struct.Struct("<BBH")
+_BINARY_AIRCRAFT = struct.Struct("<3sBiiiHH")
+
+
+def _binary_address(address: str):
+    """3-byte form of a 24-bit hex ICAO address, or None if it is not one (e.g. TIS-B '~' addresses)."""
+    try:
+        return bytes.fromhex(address) if len(address) == 6 else None
+    except (ValueError, TypeError):
+        return None
+
+
+def encode_binary_aircraft(address_bytes: bytes, fields: dict) -> bytes:
+    """Packs one aircraft record from a dict of PlaneData fields."""
+    flags = 0
+    latitude = fields.get("latitude")
+    longitude = fields.get("longitude")
+    altitude = fields.get("altitude")
+    speed = fields.get("speed")
+    heading = fields.get("heading")
+    callsign = fields.get("callsign")
+    lat_e7 = lon_e7 = alt_ft = speed_d = heading_c = 0
+    if latitude is not None and longitude is not None:
+        flags |= BINARY_FLAG_POSITION
+        lat_e7 = int(round(latitude * 1e7))
+        lon_e7 = int(round(longitude * 1e7))
+    if altitude is not None:
+        flags |= BINARY_FLAG_ALTITUDE
+        alt_ft = min(0x7FFFFFFF, max(-0x80000000, int(round(altitude))))
+    if speed is not None:
+        flags |= BINARY_FLAG_SPEED
+        speed_d = min(0xFFFF, max(0, int(round(speed * 10))))
+    if heading is not None:
+        flags |= BINARY_FLAG_HEADING
+        heading_c = int(round((heading % 360.0) * 100)) % 36000
+    if callsign:
+        flags |= BINARY_FLAG_CALLSIGN
+        return _BINARY_AIRCRAFT.pack(address_bytes, flags, lat_e7, lon_e7, alt_ft, speed_d, heading_c) + \
+            callsign.encode("ascii", "replace")[:8].ljust(8)
+    return _BINARY_AIRCRAFT.pack(address_bytes, flags, lat_e7, lon_e7, alt_ft, speed_d, heading_c)
+
+
+def encode_binary_update(address: str, fields: dict):
+    """Single-aircraft update frame, or None if the address is not a 24-bit ICAO address."""
+    address_bytes = _binary_address(address)
+    if address_bytes is None:
+        return None
+    return _BINARY_HEADER.pack(BINARY_VERSION, BINARY_FRAME_UPDATE, 1) + encode_binary_aircraft(address_bytes, fields)
+
+
+def _binary_frames(frame_type: int, packed: list) -> list:
+    frames = []
+    for start in range(0, len(packed) or 1, BINARY_MAX_RECORDS):
+        chunk = packed[start:start + BINARY_MAX_RECORDS]
+        frames.append(_BINARY_HEADER.pack(BINARY_VERSION, frame_type, len(chunk)) + b"".join(chunk))
+    return frames
+
+
+def encode_binary_frames(frame_type: int, records) -> list:
+    """Encodes (address, fields) pairs into binary frames of up to BINARY_MAX_RECORDS records.
+    Aircraft without a 24-bit ICAO address are skipped."""
+    packed = []
+    for address, fields in records:
+        address_bytes = _binary_address(address)
+        if address_bytes is not None:
+            packed.append(encode_binary_aircraft(address_bytes, fields))
+    if not packed and frame_type != BINARY_FRAME_SNAPSHOT:
+        return [] # An empty snapshot still tells the client there is nothing to show
+    return _binary_frames(frame_type, packed)
+
+
+def encode_binary_states(frame_type: int, states: list) -> list:
+    """Encodes the current state of each aircraft into binary frames."""
+    return encode_binary_frames(frame_type, [(state.address, state.fields) for state in states])
+
+
+def encode_binary_removal(addresses: list) -> list:
+    """Encodes remove frames for the given aircraft addresses."""
+    packed = [address_bytes for address_bytes in map(_binary_address, addresses) if address_bytes is not None]
+    return _binary_frames(BINARY_FRAME_REMOVE, packed) if packed else []
+
+
+class ClientSession:
+    """Per-client state: the websocket, its bounded outbound queue and the writer task draining it."""
+
+    def __init__(self, websocket_client, delta: bool = False, batch: bool = False, binary: bool = False):
+        self.websocket = websocket_client
+        self.queue = OutboundQueue(CLIENT_QUEUE_MAXSIZE, SLOW_CONSUMER_POLICY)
+        self.sent_count = 0
+        self.max_lag = 0.0
+        self.close_task = None # Set once the slow-consumer policy decided to disconnect this client
+        self.geofence = None # Only aircraft inside are sent once the client subscribes (see GeofenceIndex)
+        self.delta = delta # Only send the fields that changed since this client's last frame for an aircraft
+        self.sent_fields = {} # Delta mode: address -> field values as this client last received them
+        self.batch = batch # Collect updates and send them as one frame every BATCH_FLUSH_INTERVAL
+        self.pending_batch = OrderedDict() # Batch mode: address -> AircraftState, or the merged changes in delta mode
+        self.binary = binary # Aircraft data goes out in the adsb.bin.v1 format instead of JSON
+        self.payload_bytes = 0 # Data frame bytes before permessage-deflate
+        self.wire_bytes = 0    # The same frames after permessage-deflate
+        self.compression = None # Negotiated PerMessageDeflate extension, if any
+        self._meter_compression()
+
+    def _meter_compression(self):
+        """Wraps the connection's permessage-deflate encoder to count bytes before and after compression."""
+        for extension in getattr(self.websocket, "extensions", None) or ():
+            if isinstance(extension, PerMessageDeflate):
+                self.compression = extension
+                encode = extension.encode
+
+                def metered_encode(frame, encode=encode):
+                    encoded = encode(frame)
+                    if encoded is not frame: # Control frames pass through unchanged
+                        self.payload_bytes += len(frame.data)
+                        self.wire_bytes += len(encoded.data)
+                    return encoded
+
+                extension.encode = metered_encode
+
+    def enqueue(self, message_str: str, key=None):
+        """Queues a message without ever waiting on the socket, applying the slow-consumer policy."""
+        if self.close_task is not None:
+            return
+        dropped_before = self.queue.dropped_count
+        accepted = self.queue.put(message_str, key)
+        lag = self.queue.oldest_age(time.monotonic())
+        self.max_lag = max(self.max_lag, lag)
+
+        if not accepted or (self.queue.policy == "disconnect" and lag > CLIENT_MAX_LAG_SECONDS):
+            logger.warning(f"Client {self.websocket.remote_address} is too slow (queued {len(self.queue)}, lag {lag:.1f}s). Disconnecting.")
+            self.close_task = asyncio.create_task(
+                self.websocket.close(code=SLOW_CONSUMER_CLOSE_CODE, reason="Client too slow"),
+                name=f"SlowClientClose_{self.websocket.remote_address}",
+            )
+        elif self.queue.dropped_count != dropped_before:
+            if self.delta: # The dropped frame may have carried changes, so send every aircraft in full again
+                self.sent_fields.clear()
+            if self.queue.dropped_count % 100 == 1:
+                logger.warning(f"Client {self.websocket.remote_address} is lagging. Dropped {self.queue.dropped_count} frames so far.")
+
+    def send_snapshot(self, states: list = None):
+        """Queues a snapshot of the given aircraft (default: all of them); in delta mode later updates are relative to it."""
+        self.pending_batch.clear() # Anything waiting is older than the snapshot
+        if states is None: # Same for every client until the table changes, e.g. when all tablets reconnect at once
+            states = AIRCRAFT_TABLE.states()
+            SNAPSHOT_CACHE.reset_for(AIRCRAFT_TABLE.version)
+            cache = SNAPSHOT_CACHE
+        else:
+            cache = None
+        if self.binary:
+            frames = cache.get("bin", encode_binary_states, BINARY_FRAME_SNAPSHOT, states) if cache else \
+                encode_binary_states(BINARY_FRAME_SNAPSHOT, states)
+            for frame in frames:
+                self.enqueue(frame)
+        else:
+            self.enqueue(cache.get("json", build_snapshot, states) if cache else build_snapshot(states))
+        if self.delta:
+            self.sent_fields = {state.address: dict(state.fields) for state in states}
+
+    def send_update(self, message_str: str, state):
+        """Queues an aircraft update: the upstream message as-is, or only the changed fields in delta mode.
+        In batch mode the update waits in pending_batch, where a newer one for the same aircraft replaces it."""
+        if not self.delta:
+            if self.batch:
+                self.pending_batch[state.address] = state # Serialized at flush time, so always the latest
+            elif self.binary:
+                frame = ENCODE_CACHE.get(("bin", state.address), encode_binary_update, state.address, state.fields)
+                if frame is not None:
+                    self.enqueue(frame, state.address)
+            else:
+                self.enqueue(message_str, state.address)
+            return
+
+        sent = self.sent_fields.get(state.address)
+        if sent is None:
+            sent = self.sent_fields[state.address] = {}
+        fields = state.fields
+        changes = {name: value for name, value in fields.items() if sent.get(name) != value}
+        if not changes:
+            return
+        if ("latitude" in changes) != ("longitude" in changes): # Position always travels as a pair
+            changes["latitude"] = fields.get("latitude")
+            changes["longitude"] = fields.get("longitude")
+        sent.update(changes)
+        if self.batch:
+            pending = self.pending_batch.get(state.address)
+            if pending is None:
+                pending = self.pending_batch[state.address] = {"address": state.address}
+            pending.update(changes)
+            return
+        # Clients that are in sync get the same changes, so the delta is encoded once for all of them.
+        # No coalescing key below: replacing a queued delta would lose its fields
+        key = (self.binary, state.address, tuple(changes.items()))
+        if self.binary:
+            frame = ENCODE_CACHE.get(key, encode_binary_update, state.address, changes)
+            if frame is not None:
+                self.enqueue(frame)
+            return
+        self.enqueue(ENCODE_CACHE.get(key, encode_json_delta, state.address, changes))
+
+    def flush_batch(self):
+        """Queues everything collected in the current batch window as one frame."""
+        if not self.pending_batch:
+            return
+        items = list(self.pending_batch.values())
+        self.pending_batch.clear()
+        if self.delta: # Merged per-client changes, nothing to share
+            if self.binary:
+                for frame in encode_binary_frames(BINARY_FRAME_BATCH, [(item["address"], item) for item in items]):
+                    self.enqueue(frame)
+            else:
+                self.enqueue(json.dumps({"type": "batch", "aircraft": items}))
+            return
+        # Full states are serialized at flush time, so clients that collected the same aircraft get the same frame
+        key = (self.binary, "batch", tuple(state.address for state in items))
+        if self.binary:
+            for frame in ENCODE_CACHE.get(key, encode_binary_states, BINARY_FRAME_BATCH, items):
+                self.enqueue(frame)
+        else:
+            self.enqueue(ENCODE_CACHE.get(key, build_batch, items))
+
+    def send_removal(self, addresses: list, message_str: str = None):
+        """Queues a remove frame for aircraft this client should drop."""
+        for address in addresses:
+            self.pending_batch.pop(address, None)
+            if self.delta:
+                self.sent_fields.pop(address, None)
+        if self.binary:
+            for frame in ENCODE_CACHE.get((True, "remove", tuple(addresses)), encode_binary_removal, addresses):
+                self.enqueue(frame)
+        else:
+            self.enqueue(message_str or json.dumps({"type": "remove", "addresses": addresses}))
+
+    def stats(self) -> dict:
+        """Queue and compression statistics for this client, used for logging."""
+        compression = None
+        if self.compression is not None:
+            compression = {
+                "ratio": round(self.wire_bytes / self.payload_bytes, 3) if self.payload_bytes else None,
+                "payload_kb": round(self.payload_bytes / 1024, 1),
+                "wire_kb": round(self.wire_bytes / 1024, 1),
+                "window_bits": self.compression.local_max_window_bits,
+                "context_takeover": not self.compression.local_no_context_takeover,
+            }
+        return {
+            "format": "binary" if self.binary else "json",
+            "policy": self.queue.policy,
+            "queued": len(self.queue),
+            "sent": self.sent_count,
+            "dropped": self.queue.dropped_count,
+            "coalesced": self.queue.coalesced_count,
+            "lag_s": round(self.queue.oldest_age(time.monotonic()), 2),
+            "max_lag_s": round(self.max_lag, 2),
+            "compression": compression,
+        }
+
+    async def read_messages(self):
+        """Handles requests sent by the client until the connection closes."""
+        async for message_str in self.websocket:
+            try:
+                handle_client_message(self, message_str)
+            except Exception as e: # A bad request must not end the connection
+                logger.error(f"Error handling message from {self.websocket.remote_address}: {e}. Message: {str(message_str)[:100]}", exc_info=True)
+                self.enqueue(json.dumps({"type": "error", "message": "request could not be handled"}))
+
+    async def run_writer(self):
+        """Sends queued messages to the client until the connection closes."""
+        while True:
+            message_str = await self.queue.get()
+            await self.websocket.send(message_str)
+            self.sent_count += 1
 
 
 async def register_client(websocket_client, path: str):
@@ -34,14 +1223,21 @@ async def register_client(websocket_client, path: str):
             pass # closed
         return
 
-    CONNECTED_CLIENTS.add(websocket_client)
-    logger.info(f"Client connected: {websocket_client.remote_address} (Path: '{path}'). Total clients: {len(CONNECTED_CLIENTS)}")
-    client_wait_task = asyncio.create_task(websocket_client.wait_closed(), name=f"ClientWait_{websocket_client.remote_address}")
+    options = client_options(path)
+    binary = options["format"] == "bin" or websocket_client.subprotocol == BINARY_SUBPROTOCOL
+    session = ClientSession(websocket_client, delta=options["delta"], batch=options["batch"], binary=binary)
+    if SEND_SNAPSHOT_ON_CONNECT:
+        session.send_snapshot() # Queued before live updates can reach this client
+    CONNECTED_CLIENTS[websocket_client] = session
+    GEOFENCE_INDEX.add(session)
+    logger.info(f"Client connected: {websocket_client.remote_address} (Path: '{path}', options: {options}). Total clients: {len(CONNECTED_CLIENTS)}")
+    reader_task = asyncio.create_task(session.read_messages(), name=f"ClientReader_{websocket_client.remote_address}")
     shutdown_listen_task = asyncio.create_task(shutdown_event.wait(), name=f"ClientShutdownListen_{websocket_client.remote_address}")
+    writer_task = asyncio.create_task(session.run_writer(), name=f"ClientWriter_{websocket_client.remote_address}")
 
     try:
         done, pending = await asyncio.wait(
-            [client_wait_task, shutdown_listen_task],
+            [reader_task, shutdown_listen_task, writer_task],
             return_when=asyncio.FIRST_COMPLETED,
         )
 
@@ -49,96 +1245,766 @@ async def register_client(websocket_client, path: str):
             logger.info(f"Server shutting down. Closing client: {websocket_client.remote_address}")
             if not websocket_client.closed:
                 await websocket_client.close(code=1012, reason="Server shutting down")
+        else:
+            for task in (reader_task, writer_task):
+                if task in done and not task.cancelled() and task.exception():
+                    raise task.exception() # surfaces the receive/send error below
         # client closed connection or an error occurred on it
 
-        # Cancel any pending task from this pair
+        # Cancel any pending task from this trio
         for task in pending:
             task.cancel()
             try:
                 await task # llow cancellation to propagate
-            except asyncio.CancelledError:
+            except (asyncio.CancelledError, websockets.exceptions.ConnectionClosed):
                 pass
 
-    except websockets.exceptions.ConnectionClosedOK: # might be caught by wait_closed() itself
+    except websockets.exceptions.ConnectionClosedOK: # might be caught by the reader itself
         logger.info(f"Client connection closed OK by client: {websocket_client.remote_address}")
     except websockets.exceptions.ConnectionClosedError as e:
         logger.warning(f"Client connection closed with error: {websocket_client.remote_address} - {e}")
     except Exception as e:
         logger.error(f"Unexpected error in client handler {websocket_client.remote_address}: {e}", exc_info=True)
     finally:
-        if websocket_client in CONNECTED_CLIENTS:
-            CONNECTED_CLIENTS.remove(websocket_client)
-        logger.info(f"Client session ended: {websocket_client.remote_address}. Total clients: {len(CONNECTED_CLIENTS)}")
+        if not writer_task.done():
+            writer_task.cancel()
+        CONNECTED_CLIENTS.pop(websocket_client, None)
+        GEOFENCE_INDEX.discard(session)
+        logger.info(f"Client session ended: {websocket_client.remote_address}. Stats: {session.stats()}. Total clients: {len(CONNECTED_CLIENTS)}")
+
+
+def client_options(path: str) -> dict:
+    """Per-client options from the connection URL's query string, e.g. ws://host:9000/?delta=1&batch=1&format=bin."""
+    query = parse_qs(urlsplit(path or "").query)
+
+    def flag(name, default):
+        values = query.get(name)
+        return values[-1].lower() in ("1", "true", "yes") if values else default
+
+    return {
+        "delta": flag("delta", False),
+        "batch": flag("batch", BATCH_UPDATES_BY_DEFAULT),
+        "format": query.get("format", ["json"])[-1].lower(),
+    }
+
+
+def encode_json_delta(address: str, changes: dict) -> str:
+    """JSON delta update: the address plus only the fields that changed."""
+    delta = {"address": address}
+    delta.update(changes)
+    return json.dumps(delta)
+
+
+def build_batch(states: list) -> str:
+    """One JSON frame with the current state of each aircraft updated during a batch window."""
+    return json.dumps({"type": "batch", "aircraft": [state.to_dict() for state in states]})
+
+
+def build_snapshot(states: list = None) -> str:
+    """One JSON frame holding the latest state of the given aircraft, by default every tracked one."""
+    if states is None:
+        states = AIRCRAFT_TABLE.states()
+    return json.dumps({"type": "snapshot", "aircraft": [state.to_dict() for state in states]})
+
+
+def send_view(session: ClientSession, geofence: Geofence, also_held=()):
+    """Points a client at geofence (None = every aircraft) and brings it in sync: a remove frame for the aircraft
+    it holds that are out of view, then a snapshot of the ones in view. also_held are aircraft no longer in the
+    table that the client may still hold."""
+    if session.geofence is None:
+        held = set(AIRCRAFT_TABLE.aircraft)
+    else:
+        held = {address for address, sessions in GEOFENCE_INDEX.viewers.items() if session in sessions}
+    held.update(also_held)
+    if geofence is None:
+        GEOFENCE_INDEX.unsubscribe(session)
+        inside = None
+        held.difference_update(AIRCRAFT_TABLE.aircraft)
+    else:
+        inside = AIRCRAFT_TABLE.select(geofence)
+        GEOFENCE_INDEX.subscribe(session, geofence, [state.address for state in inside])
+        held.difference_update(state.address for state in inside)
+    if held:
+        session.send_removal(sorted(held))
+    session.send_snapshot(inside)
+
+
+def handle_client_message(session: ClientSession, message_str):
+    """Handles one request from a client, e.g. {"type": "subscribe", "latitude": .., "longitude": .., "radius_km": ..}."""
+    try:
+        message = json.loads(message_str)
+        message_type = message.get("type")
+    except (ValueError, AttributeError):
+        logger.warning(f"Ignoring malformed message from {session.websocket.remote_address}: {str(message_str)[:100]}")
+        return
+
+    if message_type == "subscribe":
+        try:
+            geofence = Geofence.from_message(message)
+        except ValueError as e:
+            logger.warning(f"Bad subscribe from {session.websocket.remote_address}: {e}")
+            session.enqueue(json.dumps({"type": "error", "message": str(e)}))
+            return
+        send_view(session, geofence)
+        logger.info(f"Client {session.websocket.remote_address} subscribed to {geofence}")
+    elif message_type == "unsubscribe":
+        send_view(session, None)
+        logger.info(f"Client {session.websocket.remote_address} unsubscribed, receiving all aircraft")
+    elif message_type == "seek":
+        try:
+            wall_time = request_replay_seek(message.get("time"))
+        except ValueError as e:
+            logger.warning(f"Bad seek from {session.websocket.remote_address}: {e}")
+            session.enqueue(json.dumps({"type": "error", "message": str(e)}))
+            return
+        logger.info(f"Client {session.websocket.remote_address} moved the replay to {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(wall_time))}")
+    elif message_type == "trail":
+        address = message.get("address")
+        trail = TRAILS.get(address) if isinstance(address, str) else None
+        session.enqueue(json.dumps({"type": "trail", "address": address, "points": trail.to_list() if trail else []}))
+    elif message_type == "receiver_stats":
+        session.enqueue(json.dumps({"type": "receiver_stats", "receivers": receiver_summaries()}))
+    else:
+        logger.warning(f"Unknown message type '{message_type}' from {session.websocket.remote_address}")
 
 
-async def broadcast_message(message_str: str):
-    """Sends a message to all connected local clients."""
+def broadcast_message(message_str: str, state: AircraftState = None):
+    """Queues a message for every connected local client. Never waits on a client socket.
+    state is the aircraft the message is about; it is checked against geofences and lets the
+    coalesce-latest policy replace stale frames. Messages without one go to everyone."""
     if not message_str:
         logger.debug("Broadcast attempt with empty message. Skipping.")
         return
 
     if CONNECTED_CLIENTS:
         logger.debug(f"Broadcasting to {len(CONNECTED_CLIENTS)} clients: {message_str[:100]}...")
-        clients_to_send = list(CONNECTED_CLIENTS)
-        tasks = []
-        for client in clients_to_send:
-            if client.open:
-                tasks.append(asyncio.create_task(client.send(message_str), name=f"SendTo_{client.remote_address}"))
-            else:
-                logger.warning(f"Client {client.remote_address} was closed. Skipping send.")
-
-        if tasks:
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            for i, result in enumerate(results): #  tasks and results maintain order
-                if isinstance(result, Exception):
-                    # the original task to get its name for better logging if needed
-                    original_task = tasks[i]
-                    logger.error(f"Error sending (Task: {original_task.get_name()}): {result}")
+        ENCODE_CACHE.clear()
+        if state is None:
+            for session in list(CONNECTED_CLIENTS.values()):
+                if session.websocket.open:
+                    session.enqueue(message_str)
+                else:
+                    logger.debug(f"Client {session.websocket.remote_address} was closed. Skipping send.")
+            return
+
+        for session in GEOFENCE_INDEX.unfenced:
+            session.send_update(message_str, state)
+        inside, left = GEOFENCE_INDEX.route(state)
+        for session in inside:
+            session.send_update(message_str, state)
+        if left:
+            remove_str = json.dumps({"type": "remove", "addresses": [state.address]})
+            for session in left:
+                session.send_removal([state.address], remove_str)
     else:
         logger.debug("No clients connected to broadcast to.")
 
 
-async def receive_from_external_adsb():
-    """Connects to the external ADS-B source and forwards messages. Stops when shutdown_event is set."""
-    logger.info("External ADS-B receiver task started.")
+def broadcast_removal(addresses: list):
+    """Tells clients that aircraft are no longer tracked. Geofenced clients only hear about ones they were sent."""
+    message_str = json.dumps({"type": "remove", "addresses": addresses})
+    ENCODE_CACHE.clear()
+    for session in GEOFENCE_INDEX.unfenced:
+        session.send_removal(addresses, message_str)
+
+    visible = {} # geofenced session -> addresses it was sent
+    for address in addresses:
+        for session in GEOFENCE_INDEX.forget(address):
+            visible.setdefault(session, []).append(address)
+    for session, session_addresses in visible.items():
+        session.send_removal(session_addresses, message_str if len(session_addresses) == len(addresses) else None)
+
+
+def forget_aircraft(addresses: list):
+    """Drops what the geofence index and delta clients remember about aircraft that are no longer tracked,
+    without telling the clients (broadcast_removal does both)."""
+    for address in addresses:
+        GEOFENCE_INDEX.forget(address)
+    for session in CONNECTED_CLIENTS.values():
+        if session.sent_fields:
+            for address in addresses:
+                session.sent_fields.pop(address, None)
+
+
+def dead_reckoning_error_m(state: AircraftState, now: float):
+    """Meters between the aircraft's position and where clients extrapolate it from the last forwarded update:
+    along the forwarded speed/heading, or else along the velocity between the last two forwarded positions
+    (RadarDisplay with extrapolateBetweenUpdates follows the same model). None without a position to compare."""
+    emitted = state.emitted_fields
+    latitude, longitude = state.fields.get("latitude"), state.fields.get("longitude")
+    emitted_latitude, emitted_longitude = emitted.get("latitude"), emitted.get("longitude")
+    if None in (latitude, longitude, emitted_latitude, emitted_longitude):
+        return None
+    elapsed = now - state.emitted_at
+    speed, heading = emitted.get("speed"), emitted.get("heading")
+    if speed is not None and heading is not None:
+        predicted_latitude, predicted_longitude = predict_position(emitted_latitude, emitted_longitude, speed, heading, elapsed)
+    elif state.emitted_velocity is not None:
+        latitude_rate, longitude_rate = state.emitted_velocity
+        predicted_latitude, predicted_longitude = emitted_latitude + latitude_rate * elapsed, emitted_longitude + longitude_rate * elapsed
+    else:
+        predicted_latitude, predicted_longitude = emitted_latitude, emitted_longitude
+    return distance_km(predicted_latitude, predicted_longitude, latitude, longitude) * 1000.0
+
+
+def should_emit(state: AircraftState, now: float) -> bool:
+    """Per-aircraft rate limit: at most one update per EMIT_MIN_INTERVAL, optionally only once it moved
+    EMIT_MIN_MOVEMENT_M, or with DEAD_RECKONING only once it left its extrapolated track.
+    A new aircraft, a new callsign or a big altitude step always goes through."""
+    emitted = state.emitted_fields
+    fields = state.fields
+    if emitted is not None:
+        altitude = fields.get("altitude")
+        emitted_altitude = emitted.get("altitude")
+        significant = fields.get("callsign") != emitted.get("callsign") or (
+            altitude is not None and emitted_altitude is not None and abs(altitude - emitted_altitude) >= EMIT_ALTITUDE_STEP_FT)
+        if not significant:
+            if now - state.emitted_at < EMIT_MIN_INTERVAL:
+                return False
+            if DEAD_RECKONING:
+                if now - state.emitted_at < DEAD_RECKONING_HEARTBEAT_SECONDS:
+                    error = dead_reckoning_error_m(state, now)
+                    if error is not None and error < DEAD_RECKONING_MAX_ERROR_M:
+                        return False
+            elif EMIT_MIN_MOVEMENT_M > 0 and not any(
+                    fields.get(name) != emitted.get(name) for name in AIRCRAFT_FIELDS
+                    if name not in BOOKKEEPING_FIELDS and name != "latitude" and name != "longitude"):
+                latitude, longitude = fields.get("latitude"), fields.get("longitude")
+                emitted_latitude, emitted_longitude = emitted.get("latitude"), emitted.get("longitude")
+                if None not in (latitude, longitude, emitted_latitude, emitted_longitude) and \
+                        distance_km(emitted_latitude, emitted_longitude, latitude, longitude) * 1000.0 < EMIT_MIN_MOVEMENT_M:
+                    return False
+    if emitted is not None and now > state.emitted_at and None not in (
+            fields.get("latitude"), fields.get("longitude"), emitted.get("latitude"), emitted.get("longitude")):
+        elapsed = now - state.emitted_at
+        state.emitted_velocity = ((fields["latitude"] - emitted["latitude"]) / elapsed,
+                                  (fields["longitude"] - emitted["longitude"]) / elapsed)
+    state.emitted_fields = dict(fields)
+    state.emitted_at = now
+    return True
+
+
+def clean_record(record: dict) -> dict:
+    """The record without values the relay cannot work with: numeric fields that are not finite numbers
+    (e.g. an altitude of "ground") or out of bounds, text fields that are not strings and timestamps that are
+    neither strings nor numbers. Numeric strings
+    become numbers, and a position loses both coordinates if either is bad. Returns the record itself if
+    nothing had to change, else a cleaned copy."""
+    cleaned = None
+    for name, bounds in NUMERIC_FIELDS.items():
+        value = record.get(name)
+        if value is None:
+            continue
+        number = value
+        if type(value) is not float and type(value) is not int:
+            try:
+                number = float(value) if not isinstance(value, bool) else math.nan
+            except (TypeError, ValueError):
+                number = math.nan
+        valid = math.isfinite(number) and (bounds is None or bounds[0] <= number <= bounds[1])
+        if valid and number is value:
+            continue
+        if cleaned is None:
+            cleaned = dict(record)
+        if valid:
+            cleaned[name] = number
+        else:
+            del cleaned[name]
+    for name in TEXT_FIELDS:
+        value = record.get(name)
+        if value is not None and not isinstance(value, str):
+            if cleaned is None:
+                cleaned = dict(record)
+            del cleaned[name]
+    value = record.get("timestamp") # Unix seconds or an ISO 8601 string, see report_time
+    if value is not None and (isinstance(value, bool) or not isinstance(value, (str, int, float))):
+        if cleaned is None:
+            cleaned = dict(record)
+        del cleaned["timestamp"]
+    if cleaned is None:
+        return record
+    if ("latitude" in cleaned) != ("longitude" in cleaned): # A position is only usable as a pair
+        cleaned.pop("latitude", None)
+        cleaned.pop("longitude", None)
+    return cleaned
+
+
+def report_time(value):
+    """Upstream timestamp as seconds since the epoch, from Unix seconds or an ISO 8601 string. None if unreadable."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def is_older_report(state: AircraftState, record: dict) -> bool:
+    """True if the record's timestamp is before the one already stored for the aircraft."""
+    reported, current_reported = report_time(record.get("timestamp")), report_time(state.fields.get("timestamp"))
+    return reported is not None and current_reported is not None and reported < current_reported
+
+
+REPORT_NEW = "new"             # Forward as usual
+REPORT_STRONGER = "stronger"   # Same report heard better by another receiver: keep it, forward only what it changes
+REPORT_DUPLICATE = "duplicate" # Same or older report heard by another receiver: drop it
+
+
+def classify_report(state: AircraftState, record: dict, now: float) -> str:
+    """Cross-receiver deduplication. The receiver that last reported an aircraft owns its track; within
+    DEDUP_WINDOW_SECONDS another receiver's report only counts if it is newer (timestamp) or stronger (rssi)."""
+    if state is None or DEDUP_WINDOW_SECONDS <= 0:
+        return REPORT_NEW
+    fields = state.fields
+    receiver = record.get("receiver")
+    current_receiver = fields.get("receiver")
+    if receiver is None or current_receiver is None or receiver == current_receiver:
+        return REPORT_NEW
+    if now - state.field_times.get("receiver", 0.0) >= DEDUP_WINDOW_SECONDS:
+        return REPORT_NEW # The current receiver went quiet, hand the track over
+    reported, current_reported = report_time(record.get("timestamp")), report_time(fields.get("timestamp"))
+    if reported is not None and current_reported is not None:
+        if reported > current_reported:
+            return REPORT_NEW
+        if reported < current_reported:
+            return REPORT_DUPLICATE
+    rssi, current_rssi = record.get("rssi"), fields.get("rssi")
+    if rssi is not None and (current_rssi is None or rssi > current_rssi):
+        return REPORT_STRONGER
+    return REPORT_DUPLICATE
+
+
+def ingest_record(record: dict, message_str: str, now: float):
+    """Merges one upstream aircraft record and forwards it unless deduplication or the rate limit holds it back.
+    message_str is the record's JSON if already at hand."""
+    cleaned = clean_record(record)
+    if cleaned is not record:
+        RELAY_STATS["invalid"] += 1
+        record, message_str = cleaned, None
+    note_receiver(record, now)
+    known = AIRCRAFT_TABLE.get(record.get("address"))
+    report = classify_report(known, record, now)
+    fuse = FUSION_TIME_CONSTANT > 0 and record.get("latitude") is not None and record.get("longitude") is not None
+    if fuse and known is not None and not is_older_report(known, record):
+        latitude, longitude = fuse_position(known, record, now)
+        # Duplicates only refine the track, the next forwarded report carries it
+        if report != REPORT_DUPLICATE and (latitude != record["latitude"] or longitude != record["longitude"]):
+            record = dict(record, latitude=round(latitude, 6), longitude=round(longitude, 6))
+            message_str = None
+    if report == REPORT_DUPLICATE:
+        AIRCRAFT_TABLE.touch(known, now) # Still heard, just not news
+        RELAY_STATS["deduplicated"] += 1
+        return
+    state, changed = AIRCRAFT_TABLE.update(record, now)
+    if state is None:
+        broadcast_message(message_str or json.dumps(record)) # No address, nothing to track
+        return
+    if fuse and known is None:
+        fuse_position(state, record, now)
+    if TRAIL_MAX_POINTS > 0 and ("latitude" in changed or "longitude" in changed):
+        fields = state.fields
+        if fields.get("latitude") is not None and fields.get("longitude") is not None:
+            TRAILS.add(state.address, fields["latitude"], fields["longitude"], fields.get("altitude"), time.time())
+    if report == REPORT_STRONGER and all(name in BOOKKEEPING_FIELDS for name in changed):
+        RELAY_STATS["deduplicated"] += 1
+        return
+    if EMIT_MIN_INTERVAL > 0 or DEAD_RECKONING:
+        if not should_emit(state, now):
+            RELAY_STATS["rate_limited"] += 1
+            HELD_UPDATES[state.address] = state
+            return
+        HELD_UPDATES.pop(state.address, None)
+    broadcast_message(message_str or json.dumps(record), state)
+
+
+def release_held_updates(now: float):
+    """Forwards the latest state of aircraft whose update the rate limit held back, once their EMIT_MIN_INTERVAL
+    has passed, so clients catch up even if no newer report arrives. should_emit decides again, so updates
+    that moved too little or stay on the dead-reckoned track are still dropped."""
+    for address, state in list(HELD_UPDATES.items()):
+        if now - state.emitted_at < EMIT_MIN_INTERVAL:
+            continue
+        del HELD_UPDATES[address]
+        try:
+            if AIRCRAFT_TABLE.get(address) is state and should_emit(state, now):
+                broadcast_message(json.dumps(state.to_dict()), state)
+        except Exception as e:
+            logger.error(f"Error releasing held update for {address} ({type(e).__name__}: {e}): {state.fields}", exc_info=True)
+
+
+def ingest_message(message_str: str):
+    """Parses an upstream message once, merges it into AIRCRAFT_TABLE and forwards it to clients."""
+    RELAY_STATS["received"] += 1
+    try:
+        data = json.loads(message_str)
+    except ValueError:
+        logger.debug(f"Upstream message is not JSON, forwarding as-is: {message_str[:100]}")
+        broadcast_message(message_str)
+        return
+
+    now = relay_time()
+    if isinstance(data, list): # Forward each aircraft as its own frame so it can be filtered per client
+        for record in data:
+            if isinstance(record, dict):
+                ingest_record_safely(record, None, now)
+    elif isinstance(data, dict):
+        ingest_record_safely(data, message_str, now)
+    else:
+        broadcast_message(message_str)
+
+
+def ingest_record_safely(record: dict, message_str: str, now: float):
+    """ingest_record, but a record it cannot handle is logged and skipped instead of ending the upstream connection."""
+    try:
+        ingest_record(record, message_str, now)
+    except Exception as e:
+        RELAY_STATS["invalid"] += 1
+        logger.error(f"Skipping upstream record that could not be ingested ({type(e).__name__}: {e}): {str(record)[:200]}", exc_info=True)
+
+
+async def consume_external_adsb(external_websocket, uri: str = EXTERNAL_WS_URI):
+    """Feeds every message from an open upstream WebSocket into the relay until it closes."""
+    async for message_str in external_websocket:
+        if message_str:
+            if RECORDER is not None:
+                RECORDER.record(uri, message_str)
+            ingest_message(message_str)
+
+
+async def consume_tcp_adsb(reader: asyncio.StreamReader, uri: str):
+    """Feeds every line (one JSON message each) from an open upstream TCP connection into the relay until it closes."""
+    async for line in reader:
+        line = line.strip()
+        if line:
+            if RECORDER is not None:
+                RECORDER.record(uri, line)
+            ingest_message(line.decode("utf-8", "replace"))
+
+
+async def consume_until_shutdown(consumer, uri: str):
+    """Runs an upstream consumer until its connection ends or shutdown_event is set. The whole connection is
+    raced against shutdown once, instead of a timeout around every receive."""
+    consume_task = asyncio.create_task(consumer, name=f"UpstreamConsumer_{uri}")
+    shutdown_listen_task = asyncio.create_task(shutdown_event.wait(), name=f"UpstreamShutdownListen_{uri}")
+    done, pending = await asyncio.wait(
+        [consume_task, shutdown_listen_task],
+        return_when=asyncio.FIRST_COMPLETED,
+    )
+    for task in pending:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    if consume_task in done:
+        error = consume_task.exception()
+        if error is None or isinstance(error, (websockets.exceptions.ConnectionClosed, ConnectionError)):
+            logger.warning(f"External ADS-B connection closed during receive: {uri}. Reconnecting...")
+        else:
+            logger.error(f"Error receiving from external ADS-B {uri}: {error}. Reconnecting...", exc_info=error)
+
+
+async def receive_from_external_adsb(uri: str = EXTERNAL_WS_URI):
+    """Connects to one upstream ADS-B source and forwards its messages. Reconnects until shutdown_event is set."""
+    logger.info(f"External ADS-B receiver task started: {uri}")
     while not shutdown_event.is_set():
         try:
-            logger.info(f"Attempting to connect to external ADS-B: {EXTERNAL_WS_URI}")
-            async with websockets.connect(EXTERNAL_WS_URI) as external_websocket:
-                logger.info(f"Successfully connected to external ADS-B: {EXTERNAL_WS_URI}")
-                while not shutdown_event.is_set():
-                    try:
-                        message_str = await asyncio.wait_for(external_websocket.recv(), timeout=1.0)
-                        if message_str:
-                            await broadcast_message(message_str)
-                    except asyncio.TimeoutError:
-                        continue
-                    except websockets.exceptions.ConnectionClosed:
-                        logger.warning("External ADS-B connection closed during receive. Reconnecting...")
-                        break
-                    except Exception as e:
-                        logger.error(f"Error receiving from external ADS-B: {e}. Reconnecting...", exc_info=True)
-                        break
+            logger.info(f"Attempting to connect to external ADS-B: {uri}")
+            if uri.startswith("tcp://"):
+                address = urlsplit(uri)
+                reader, writer = await asyncio.open_connection(address.hostname, address.port)
+                logger.info(f"Successfully connected to external ADS-B: {uri}")
+                try:
+                    await consume_until_shutdown(consume_tcp_adsb(reader, uri), uri)
+                finally:
+                    writer.close()
+            else:
+                async with websockets.connect(uri) as external_websocket:
+                    logger.info(f"Successfully connected to external ADS-B: {uri}")
+                    await consume_until_shutdown(consume_external_adsb(external_websocket, uri), uri)
         except (websockets.exceptions.WebSocketException, ConnectionRefusedError, OSError) as e:
-            logger.warning(f"External ADS-B connection issue ({type(e).__name__}): {e}. Retrying in 5s...")
+            logger.warning(f"External ADS-B connection issue {uri} ({type(e).__name__}): {e}. Retrying in {UPSTREAM_RETRY_SECONDS:g}s...")
         except Exception as e:
-            logger.error(f"Unexpected error in external ADS-B connection task: {e}", exc_info=True)
+            logger.error(f"Unexpected error in external ADS-B connection task {uri}: {e}", exc_info=True)
         
         if not shutdown_event.is_set():
             try:
-                await asyncio.wait_for(shutdown_event.wait(), timeout=5.0)
+                await asyncio.wait_for(shutdown_event.wait(), timeout=UPSTREAM_RETRY_SECONDS)
             except asyncio.TimeoutError:
                 pass
-    logger.info("External ADS-B receiver task stopped.")
+    logger.info(f"External ADS-B receiver task stopped: {uri}")
+
+
+def request_replay_seek(value) -> float:
+    """Asks replay_recording to continue from the time in a client's {"type": "seek", "time": ..} request.
+    Returns the wall clock time it resolved to. Raises ValueError when not replaying or the time is not in the recording."""
+    global replay_seek_time
+    if not REPLAY_PATH:
+        raise ValueError("seek is only available in replay mode")
+    recorded = adsb_recording.recording_range(REPLAY_PATH)
+    if recorded is None:
+        raise ValueError("the recording is empty")
+    replay_seek_time = adsb_recording.parse_seek_time(value, *recorded)
+    replay_seek_event.set()
+    return replay_seek_time
+
+
+async def wait_for_replay_seek() -> bool:
+    """Sleeps until a client seeks or shutdown_event is set. Returns True if a client seeked."""
+    seek_task = asyncio.create_task(replay_seek_event.wait())
+    shutdown_listen_task = asyncio.create_task(shutdown_event.wait())
+    done, pending = await asyncio.wait([seek_task, shutdown_listen_task], return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+        task.cancel()
+    return replay_seek_event.is_set()
+
+
+class ReplayClock:
+    """Recorded time while replaying, continuing from time.monotonic() when the replay began. It runs speed
+    times faster than real time, or at maximum speed steps from frame to frame, so rate limits, deduplication,
+    fusion and eviction see the gaps the recording had instead of compressed ones."""
+    __slots__ = ("speed", "origin", "started", "due", "running")
+
+    def __init__(self, speed: float):
+        self.speed = speed
+        self.origin = time.monotonic() # Reading when started
+        self.started = self.origin     # time.monotonic() of the last start()
+        self.due = 0.0                 # Maximum speed: recorded seconds between start() and the current frame
+        self.running = False
+
+    def now(self) -> float:
+        if self.running and self.speed > 0:
+            return self.origin + (time.monotonic() - self.started) * self.speed
+        return self.origin + self.due
+
+    def start(self):
+        """Starts counting recorded time from the current reading, when frames start flowing (again)."""
+        self.origin = self.now()
+        self.started = time.monotonic()
+        self.due = 0.0
+        self.running = True
+
+    def stop(self):
+        """Holds the current reading, e.g. while a seek fast-forwards or a finished replay waits."""
+        self.origin = self.now()
+        self.due = 0.0
+        self.running = False
+
+    def advance(self, due: float):
+        """Maximum speed: the frame being replayed was recorded due seconds after start()."""
+        self.due = due
+
+
+def relay_time() -> float:
+    """Clock of the aircraft bookkeeping (last_seen, rate limits, deduplication, fusion, eviction):
+    time.monotonic(), or the recorded time while replaying."""
+    return time.monotonic() if replay_clock is None else replay_clock.now()
+
+
+def fast_forward(source: str, payload: bytes, now: float) -> list:
+    """Applies a recorded frame to AIRCRAFT_TABLE without telling clients, while a replay seeks.
+    A keyframe replaces the whole table; returns the addresses that replacing it dropped."""
+    dropped = []
+    try:
+        data = json.loads(str(payload, "utf-8"))
+    except ValueError:
+        return dropped
+    if source == adsb_recording.KEYFRAME_SOURCE:
+        dropped = list(AIRCRAFT_TABLE.aircraft)
+        AIRCRAFT_TABLE.clear()
+        data = data.get("aircraft", [])
+    for record in data if isinstance(data, list) else (data,):
+        if isinstance(record, dict):
+            AIRCRAFT_TABLE.update(clean_record(record), now)
+    return dropped
+
+
+def resync_clients(dropped=()):
+    """Brings every client in sync with the table after it was rebuilt, see send_view. dropped are aircraft
+    the rebuild removed, which clients that connected meanwhile may still hold."""
+    for session in list(CONNECTED_CLIENTS.values()):
+        send_view(session, session.geofence, dropped)
+
+
+async def replay_recording(path: str, speed: float = REPLAY_SPEED):
+    """Feeds a recording into the relay like an upstream source, keeping the recorded time between frames
+    divided by speed (0 = as fast as possible); relay_time() follows the recorded time meanwhile. A client
+    "seek" restarts it at another time: the table is rebuilt from the last keyframe before it, silently
+    fast-forwarded and sent to clients as a snapshot. REPLAY_LOOP starts over with an empty table; without it,
+    the last picture stays until a seek or shutdown."""
+    global replay_clock
+    logger.info(f"Replaying {path} at {f'{speed:g}x' if speed > 0 else 'maximum'} speed")
+    loop = asyncio.get_running_loop()
+    replay_clock = ReplayClock(speed)
+    start_time = None
+    restarted = False
+    try:
+        while not shutdown_event.is_set():
+            replay_seek_event.clear()
+            seek_started = loop.time()
+            if restarted: # A seek or the next loop, the picture so far no longer applies
+                broadcast_removal(list(AIRCRAFT_TABLE.aircraft))
+                AIRCRAFT_TABLE.clear()
+                TRAILS.clear()
+                HELD_UPDATES.clear()
+            restarted = True
+            if start_time is None:
+                replay_clock.start()
+            frames = skipped = 0
+            dropped = set() # Aircraft keyframes removed from the table while fast-forwarding
+            started = loop.time()
+            due = 0.0 # Recorded seconds since the start of the replay at which the current frame arrived
+            previous = None
+            for received_at, wall_time, source, payload in adsb_recording.iter_recording(path, start_time):
+                if shutdown_event.is_set() or replay_seek_event.is_set():
+                    break
+                if start_time is not None:
+                    # A keyframe taken right at the seek time is the picture to start from, so it is applied too
+                    if wall_time < start_time or (source == adsb_recording.KEYFRAME_SOURCE and wall_time <= start_time):
+                        dropped.update(fast_forward(source, payload, relay_time()))
+                        skipped += 1
+                        if skipped % REPLAY_YIELD_EVERY == 0: # Without a keyframe nearby this can be the whole recording
+                            await asyncio.sleep(0)
+                        continue
+                    resync_clients(dropped)
+                    logger.info(f"Replay seek took {(loop.time() - seek_started) * 1000:.0f} ms, {len(AIRCRAFT_TABLE)} aircraft")
+                    start_time = None
+                    started = loop.time()
+                    replay_clock.start()
+                if source == adsb_recording.KEYFRAME_SOURCE:
+                    continue
+                if previous is not None and 0 < received_at - previous <= REPLAY_MAX_GAP_SECONDS:
+                    due += received_at - previous
+                previous = received_at
+                if speed > 0:
+                    delay = started + due / speed - loop.time()
+                    while delay > 0 and not replay_seek_event.is_set() and not shutdown_event.is_set():
+                        await asyncio.sleep(min(delay, REPLAY_WAKE_SECONDS))
+                        delay = started + due / speed - loop.time()
+                    if delay > 0:
+                        break # Seek or shutdown
+                else:
+                    replay_clock.advance(due)
+                if frames % REPLAY_YIELD_EVERY == 0:
+                    await asyncio.sleep(0)
+                ingest_message(str(payload, "utf-8", "replace"))
+                frames += 1
+            if replay_seek_event.is_set():
+                start_time = replay_seek_time
+                replay_clock.stop()
+                continue
+            if start_time is not None: # Sought past the last frame
+                resync_clients(dropped)
+            if shutdown_event.is_set():
+                break
+            elapsed = loop.time() - started
+            logger.info(f"Replay of {path} reached the end: {frames} frames in {elapsed:.1f}s ({frames / max(elapsed, 1e-9):,.0f} frames/s)")
+            start_time = None
+            if not frames or not REPLAY_LOOP:
+                replay_clock.stop()
+                if not await wait_for_replay_seek():
+                    break
+                start_time = replay_seek_time
+    finally:
+        replay_clock = None
+
+
+async def record_keyframes():
+    """Writes a snapshot of the aircraft table into the recording every RECORDING_KEYFRAME_SECONDS. Stops when shutdown_event is set."""
+    while not shutdown_event.is_set():
+        try:
+            await asyncio.wait_for(shutdown_event.wait(), timeout=RECORDING_KEYFRAME_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        if RECORDER is not None and not shutdown_event.is_set():
+            RECORDER.record_keyframe(build_snapshot())
+
+
+async def evict_stale_aircraft():
+    """Drops stale aircraft from AIRCRAFT_TABLE every tick and tells clients. Stops when shutdown_event is set."""
+    while not shutdown_event.is_set():
+        try:
+            await asyncio.wait_for(shutdown_event.wait(), timeout=EVICTION_TICK_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        expired = AIRCRAFT_TABLE.expire(relay_time())
+        for state in expired:
+            TRAILS.forget(state.address)
+            HELD_UPDATES.pop(state.address, None)
+        if expired:
+            logger.debug(f"Evicted {len(expired)} stale aircraft. Tracking {len(AIRCRAFT_TABLE)}.")
+            addresses = [state.address for state in expired]
+            if SEND_REMOVE_EVENTS:
+                broadcast_removal(addresses)
+            else:
+                forget_aircraft(addresses)
+
+
+async def flush_batches():
+    """Sends each batching client its collected updates once per BATCH_FLUSH_INTERVAL, after releasing
+    rate-limited updates that are due. Stops when shutdown_event is set."""
+    while not shutdown_event.is_set():
+        await asyncio.sleep(BATCH_FLUSH_INTERVAL)
+        if HELD_UPDATES:
+            release_held_updates(relay_time())
+        ENCODE_CACHE.clear()
+        for session in list(CONNECTED_CLIENTS.values()):
+            if session.pending_batch:
+                try:
+                    session.flush_batch()
+                except Exception as e: # The batch is dropped, the next window starts clean
+                    logger.error(f"Error flushing batch to {session.websocket.remote_address} ({type(e).__name__}: {e})", exc_info=True)
+
+
+async def log_client_stats():
+    """Periodically logs relay counters and the outbound queue stats of every client. Stops when shutdown_event is set."""
+    while not shutdown_event.is_set():
+        try:
+            await asyncio.wait_for(shutdown_event.wait(), timeout=CLIENT_STATS_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        logger.info(f"Relay stats: {RELAY_STATS}, tracking {len(AIRCRAFT_TABLE)} aircraft, {TRAILS.total_points} trail points")
+        if RECORDER is not None:
+            logger.info(f"Recorder stats: {RECORDER.stats()}")
+        for summary in receiver_summaries():
+            logger.info(f"Receiver stats: {summary}")
+        for session in list(CONNECTED_CLIENTS.values()):
+            logger.info(f"Client {session.websocket.remote_address} stats: {session.stats()}")
+
+
+def compression_extensions() -> list:
+    """permessage-deflate settings for websockets.serve, from the COMPRESSION_* configuration."""
+    if not COMPRESSION_ENABLED:
+        return []
+    return [ServerPerMessageDeflateFactory(
+        server_no_context_takeover=COMPRESSION_SERVER_NO_CONTEXT_TAKEOVER,
+        client_no_context_takeover=COMPRESSION_CLIENT_NO_CONTEXT_TAKEOVER,
+        server_max_window_bits=COMPRESSION_SERVER_MAX_WINDOW_BITS,
+        client_max_window_bits=COMPRESSION_CLIENT_MAX_WINDOW_BITS,
+        compress_settings={"level": COMPRESSION_LEVEL, "memLevel": COMPRESSION_MEM_LEVEL},
+    )]
 
 
 async def main_server_logic():
     """Main asynchronous logic to run the server and data forwarder."""
+    global RECORDER
+    if SLOW_CONSUMER_POLICY not in SLOW_CONSUMER_POLICIES:
+        logger.critical(f"CRITICAL: Unknown SLOW_CONSUMER_POLICY '{SLOW_CONSUMER_POLICY}'. Use one of {SLOW_CONSUMER_POLICIES}.")
+        return
+
     try:
         server = await websockets.serve(
             register_client,
             LOCAL_WS_HOST,
             LOCAL_WS_PORT,
+            subprotocols=[BINARY_SUBPROTOCOL],
+            compression=None, # Configured explicitly below instead of the library defaults
+            extensions=compression_extensions(),
         )
     except OSError as e:
         if e.errno == 10048:
@@ -153,19 +2019,48 @@ async def main_server_logic():
 
     logger.info(f"Local WebSocket server started on ws://{LOCAL_WS_HOST}:{LOCAL_WS_PORT}")
 
-    external_data_task = asyncio.create_task(receive_from_external_adsb(), name="ExternalDataReceiver")
+    if RECORDING_ENABLED:
+        RECORDER = adsb_recording.Recorder(
+            RECORDING_DIR,
+            segment_bytes=RECORDING_SEGMENT_BYTES,
+            segment_seconds=RECORDING_SEGMENT_SECONDS,
+            block_bytes=RECORDING_BLOCK_BYTES,
+            flush_seconds=RECORDING_FLUSH_SECONDS,
+            queue_maxsize=RECORDING_QUEUE_MAXSIZE,
+        )
+        RECORDER.start()
+
+    if REPLAY_PATH:
+        external_data_tasks = [
+            asyncio.create_task(replay_recording(REPLAY_PATH, REPLAY_SPEED), name="RecordingReplay")
+        ]
+    else:
+        if not UPSTREAM_SOURCES:
+            logger.warning("No UPSTREAM_SOURCES configured. Clients will not receive any aircraft.")
+        external_data_tasks = [
+            asyncio.create_task(receive_from_external_adsb(uri), name=f"ExternalDataReceiver_{uri}")
+            for uri in UPSTREAM_SOURCES
+        ]
     shutdown_wait_task = asyncio.create_task(shutdown_event.wait(), name="ShutdownEventWatcher")
+    client_stats_task = asyncio.create_task(log_client_stats(), name="ClientStatsLogger")
+    eviction_task = asyncio.create_task(evict_stale_aircraft(), name="StaleAircraftEviction")
+    batch_flush_task = asyncio.create_task(flush_batches(), name="BatchFlusher")
+    background_tasks = [client_stats_task, eviction_task, batch_flush_task]
+    if RECORDER is not None:
+        background_tasks.append(asyncio.create_task(record_keyframes(), name="KeyframeRecorder"))
 
     logger.info("Main server logic running. Waiting for tasks or shutdown signal...")
     done, pending = await asyncio.wait(
-        [shutdown_wait_task, external_data_task],
+        [shutdown_wait_task] + external_data_tasks,
         return_when=asyncio.FIRST_COMPLETED
     )
 
-    if external_data_task in done:
-        logger.warning("External data task finished or failed.")
-        if external_data_task.exception():
-            logger.error(f"External data task exited with exception: {external_data_task.exception()}", exc_info=external_data_task.exception())
+    finished_data_tasks = [task for task in external_data_tasks if task in done]
+    if finished_data_tasks:
+        for task in finished_data_tasks:
+            logger.warning(f"External data task {task.get_name()} finished or failed.")
+            if task.exception():
+                logger.error(f"External data task exited with exception: {task.exception()}", exc_info=task.exception())
     elif shutdown_wait_task in done:
         logger.info("Shutdown event was triggered.")
     else: # Should not happen with FIRST_COMPLETED if tasks are in the list.. I HOPE  
@@ -191,11 +2086,12 @@ async def main_server_logic():
 
 
     # Wait for the primary tasks to finish their shutdown
-    tasks_to_await = []
-    if not external_data_task.done():
-        tasks_to_await.append(external_data_task)
+    tasks_to_await = [task for task in external_data_tasks if not task.done()]
     if not shutdown_wait_task.done(): # Though it should be doneif it triggered shutdown
          tasks_to_await.append(shutdown_wait_task)
+    for task in background_tasks:
+        if not task.done():
+            tasks_to_await.append(task)
 
 
     if tasks_to_await:
@@ -215,9 +2111,25 @@ async def main_server_logic():
                     except Exception as e_task_cancel:
                         logger.error(f"Error awaiting cancelled task {task.get_name()}: {e_task_cancel}")
 
+    if RECORDER is not None:
+        logger.info("Writing out the last recorded frames...")
+        await asyncio.get_running_loop().run_in_executor(None, RECORDER.close)
+        logger.info(f"Recorder stopped: {RECORDER.stats()}")
+        RECORDER = None
+
     logger.info("Server shutdown process complete.")
 
 
+def replay_speed(value: str) -> float:
+    """argparse type for --replay-speed: a multiplier, or "max" for as fast as possible."""
+    if value == "max":
+        return 0.0
+    speed = float(value)
+    if speed < 0:
+        raise argparse.ArgumentTypeError("replay speed cannot be negative")
+    return speed
+
+
 def os_signal_handler(sig, frame):
     """Handle OS signals like SIGINT (Ctrl+C) and SIGTERM."""
     logger.info(f"Received OS signal {signal.Signals(sig).name}. Initiating graceful shutdown...")
@@ -230,6 +2142,15 @@ def os_signal_handler(sig, frame):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Relays ADS-B aircraft from upstream receivers to the AR radar app.")
+    parser.add_argument("--replay", metavar="PATH", default=REPLAY_PATH,
+                        help="serve a recording (segment file or recording directory) instead of UPSTREAM_SOURCES")
+    parser.add_argument("--replay-speed", metavar="N", type=replay_speed, default=REPLAY_SPEED,
+                        help="replay speed multiplier, or 'max' for as fast as possible (default: %(default)s)")
+    args = parser.parse_args()
+    REPLAY_PATH = args.replay
+    REPLAY_SPEED = args.replay_speed
+
     # Setup signal handlers for graceful shutdown
     signal.signal(signal.SIGINT, os_signal_handler)  # Ctrl+C
 
@@ -0,0 +1,119 @@
+"""Micro-benchmark for the upstream receive loop in adsb_server.py.
+
+Starts a fake upstream ADS-B WebSocket server in a separate process that sends a fixed number
+of PlaneData-shaped messages as fast as it can, then measures how many messages per second
+each receive loop takes in:
+  - wait_for: the old loop, asyncio.wait_for(recv(), timeout=1.0) per message to poll shutdown
+  - async for: adsb_server.consume_external_adsb, raced once against shutdown
+
+Only the receive path is measured, ingest_message is replaced by a counter.
+Usage: python bench_receive_loop.py [messages] [rounds] > bench_output.txt
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import sys
+import time
+
+import websockets
+
+import adsb_server
+
+FAKE_UPSTREAM_HOST = "127.0.0.1"
+FAKE_UPSTREAM_PORT = 9101
+
+
+def run_fake_upstream(message_count: int, ready):
+    """Serves message_count messages to every connection, then closes it."""
+    message_str = json.dumps({
+        "address": "484cb8", "altitude": 36000, "latitude": 52.2387, "longitude": 6.8564,
+        "speed": 451.0, "heading": 87.5, "callsign": "KLM1234", "timestamp": "2025-06-01T14:32:00Z",
+        "rssi": -21.4, "receiver": "utwente",
+    })
+
+    async def handler(websocket, path):
+        for _ in range(message_count):
+            await websocket.send(message_str)
+        await websocket.close()
+
+    async def serve():
+        async with websockets.serve(handler, FAKE_UPSTREAM_HOST, FAKE_UPSTREAM_PORT, compression=None):
+            ready.set()
+            await asyncio.Future() # Run until the process is terminated
+
+    asyncio.run(serve())
+
+
+async def wait_for_loop(external_websocket, shutdown_event, on_message):
+    """The receive loop as it was: a timeout around every recv() just to notice shutdown."""
+    while not shutdown_event.is_set():
+        try:
+            message_str = await asyncio.wait_for(external_websocket.recv(), timeout=1.0)
+            if message_str:
+                on_message(message_str)
+        except asyncio.TimeoutError:
+            continue
+        except websockets.exceptions.ConnectionClosed:
+            break
+
+
+async def async_for_loop(external_websocket, shutdown_event, on_message):
+    """The current receive loop: consume_external_adsb raced once against shutdown."""
+    adsb_server.ingest_message = on_message
+    consume_task = asyncio.create_task(adsb_server.consume_external_adsb(external_websocket))
+    shutdown_listen_task = asyncio.create_task(shutdown_event.wait())
+    done, pending = await asyncio.wait([consume_task, shutdown_listen_task], return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+        task.cancel()
+    if consume_task in done and consume_task.exception() and \
+            not isinstance(consume_task.exception(), websockets.exceptions.ConnectionClosed):
+        raise consume_task.exception()
+
+
+async def measure(loop_function) -> tuple:
+    """Returns (messages received, messages per second) for one full upstream connection."""
+    received = 0
+
+    def on_message(message_str):
+        nonlocal received
+        received += 1
+
+    shutdown_event = asyncio.Event()
+    async with websockets.connect(f"ws://{FAKE_UPSTREAM_HOST}:{FAKE_UPSTREAM_PORT}", compression=None,
+                                  max_queue=None) as external_websocket:
+        start = time.perf_counter()
+        await loop_function(external_websocket, shutdown_event, on_message)
+        elapsed = time.perf_counter() - start
+    return received, received / elapsed
+
+
+def main():
+    message_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    logging.getLogger().setLevel(logging.WARNING) # adsb_server configures INFO logging on import
+
+    ready = multiprocessing.Event()
+    upstream = multiprocessing.Process(target=run_fake_upstream, args=(message_count, ready), daemon=True)
+    upstream.start()
+    ready.wait(10)
+    try:
+        results = {}
+        for _ in range(rounds): # Interleaved so both loops see the same machine conditions
+            for name, loop_function in (("wait_for", wait_for_loop), ("async for", async_for_loop)):
+                received, rate = asyncio.run(measure(loop_function))
+                if received != message_count:
+                    print(f"warning: {name} received {received} of {message_count} messages")
+                results.setdefault(name, []).append(rate)
+    finally:
+        upstream.terminate()
+
+    print(f"Receive loop benchmark: {message_count} messages per round, best of {rounds} rounds")
+    for name, rates in results.items():
+        print(f"  {name:10s} {max(rates):12,.0f} msg/s")
+    speedup = max(results["async for"]) / max(results["wait_for"])
+    print(f"  async for is {speedup:.2f}x the wait_for loop")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Round-trip test of the adsb.bin.v1 wire format shared by adsb_server.py and WebSocketConection.cs.
+
+Frames are encoded with adsb_server's encode_binary_* functions and decoded with the layout as documented
+in adsb_server.py (and read by WebSocketConection.ProcessBinaryMessage), not with the encoder's own structs,
+so a change on either side that breaks the contract fails here.
+Usage: python -m unittest test_binary_format (or python -m pytest test_binary_format.py)
+"""
+import struct
+import unittest
+
+import adsb_server
+
+HEADER = struct.Struct("<BBH") # version, frame type, record count
+RECORD = struct.Struct("<3sBiiiHH") # address, flags, lat 1e-7 deg, lon 1e-7 deg, alt ft, speed 0.1 kt, heading 0.01 deg
+CALLSIGN_BYTES = 8
+FRAME_UPDATE, FRAME_SNAPSHOT, FRAME_BATCH, FRAME_REMOVE = 1, 2, 3, 4
+FLAG_POSITION, FLAG_ALTITUDE, FLAG_SPEED, FLAG_HEADING, FLAG_CALLSIGN = 1, 2, 4, 8, 16
+
+
+def decode_frame(frame: bytes):
+    """(frame type, records) of one binary frame, records as PlaneData-like dicts the way the Unity client builds them."""
+    version, frame_type, count = HEADER.unpack_from(frame)
+    assert version == 1, version
+    offset = HEADER.size
+    records = []
+    for _ in range(count):
+        if frame_type == FRAME_REMOVE:
+            records.append(frame[offset:offset + 3].hex())
+            offset += 3
+            continue
+        address, flags, lat_e7, lon_e7, alt_ft, speed_d, heading_c = RECORD.unpack_from(frame, offset)
+        offset += RECORD.size
+        record = {"address": address.hex()}
+        if flags & FLAG_POSITION:
+            record["latitude"] = lat_e7 / 1e7
+            record["longitude"] = lon_e7 / 1e7
+        if flags & FLAG_ALTITUDE:
+            record["altitude"] = alt_ft
+        if flags & FLAG_SPEED:
+            record["speed"] = speed_d / 10
+        if flags & FLAG_HEADING:
+            record["heading"] = heading_c / 100
+        if flags & FLAG_CALLSIGN:
+            record["callsign"] = frame[offset:offset + CALLSIGN_BYTES].decode("ascii").rstrip()
+            offset += CALLSIGN_BYTES
+        if not flags & (FLAG_POSITION | FLAG_ALTITUDE | FLAG_SPEED | FLAG_HEADING | FLAG_CALLSIGN):
+            assert (lat_e7, lon_e7, alt_ft, speed_d, heading_c) == (0, 0, 0, 0, 0)
+        records.append(record)
+    assert offset == len(frame), f"{len(frame) - offset} trailing bytes"
+    return frame_type, records
+
+
+class BinaryFormatRoundTrip(unittest.TestCase):
+    FULL = {"latitude": 52.2387123, "longitude": -6.8564321, "altitude": 36000, "speed": 451.3, "heading": 87.55,
+            "callsign": "KLM1234", "rssi": -21.4, "receiver": "utwente", "timestamp": "2025-06-01T14:32:00Z"}
+
+    def assert_same_aircraft(self, decoded: dict, address: str, fields: dict):
+        self.assertEqual(decoded["address"], address)
+        self.assertAlmostEqual(decoded["latitude"], fields["latitude"], places=7)
+        self.assertAlmostEqual(decoded["longitude"], fields["longitude"], places=7)
+        self.assertEqual(decoded["altitude"], fields["altitude"])
+        self.assertAlmostEqual(decoded["speed"], fields["speed"], places=1)
+        self.assertAlmostEqual(decoded["heading"], fields["heading"], places=2)
+        self.assertEqual(decoded["callsign"], fields["callsign"])
+
+    def test_update_with_every_field(self):
+        frame_type, records = decode_frame(adsb_server.encode_binary_update("484cb8", self.FULL))
+        self.assertEqual(frame_type, FRAME_UPDATE)
+        self.assertEqual(len(records), 1)
+        self.assert_same_aircraft(records[0], "484cb8", self.FULL)
+        self.assertNotIn("rssi", records[0]) # JSON only
+
+    def test_missing_fields_are_flagged_absent(self):
+        _, records = decode_frame(adsb_server.encode_binary_update("484cb8", {"altitude": 1200}))
+        self.assertEqual(records, [{"address": "484cb8", "altitude": 1200}])
+        _, records = decode_frame(adsb_server.encode_binary_update("484cb8", {}))
+        self.assertEqual(records, [{"address": "484cb8"}])
+
+    def test_value_ranges(self):
+        fields = {"latitude": -90.0, "longitude": 180.0, "altitude": -1000, "speed": 99999.0, "heading": -90.0,
+                  "callsign": "TOOLONGCALLSIGN"}
+        _, (record,) = decode_frame(adsb_server.encode_binary_update("000001", fields))
+        self.assertEqual((record["latitude"], record["longitude"]), (-90.0, 180.0))
+        self.assertEqual(record["altitude"], -1000)
+        self.assertEqual(record["speed"], 6553.5) # Clamped to the 16-bit field
+        self.assertEqual(record["heading"], 270.0) # Normalized to 0..360
+        self.assertEqual(record["callsign"], "TOOLONGC") # Cut to 8 characters
+        _, (record,) = decode_frame(adsb_server.encode_binary_update("000001", {"altitude": 1e12}))
+        self.assertEqual(record["altitude"], 2 ** 31 - 1) # Clamped to the 32-bit field
+        _, (record,) = decode_frame(adsb_server.encode_binary_update("000001", {"altitude": -1e12}))
+        self.assertEqual(record["altitude"], -2 ** 31)
+
+    def test_non_icao_addresses_have_no_binary_form(self):
+        self.assertIsNone(adsb_server.encode_binary_update("~1a2b3c", self.FULL))
+        frames = adsb_server.encode_binary_frames(FRAME_BATCH, [("~1a2b3c", self.FULL), ("abcdef", self.FULL)])
+        self.assertEqual([record["address"] for record in decode_frame(frames[0])[1]], ["abcdef"])
+
+    def test_snapshot_of_states(self):
+        table = adsb_server.AircraftTable(columnar=False)
+        for number in range(3):
+            table.update(dict(self.FULL, address=f"a0000{number}", altitude=1000 * number), 0.0)
+        frames = adsb_server.encode_binary_states(FRAME_SNAPSHOT, table.states())
+        self.assertEqual(len(frames), 1)
+        frame_type, records = decode_frame(frames[0])
+        self.assertEqual(frame_type, FRAME_SNAPSHOT)
+        for number, record in enumerate(records):
+            self.assert_same_aircraft(record, f"a0000{number}", dict(self.FULL, altitude=1000 * number))
+
+    def test_empty_snapshot_is_still_sent(self):
+        (frame,) = adsb_server.encode_binary_states(FRAME_SNAPSHOT, [])
+        self.assertEqual(decode_frame(frame), (FRAME_SNAPSHOT, []))
+        self.assertEqual(adsb_server.encode_binary_states(FRAME_BATCH, []), [])
+
+    def test_large_batches_are_split(self):
+        count = adsb_server.BINARY_MAX_RECORDS + 10
+        records = [(f"{number:06x}", {"altitude": number % 50000}) for number in range(count)]
+        frames = adsb_server.encode_binary_frames(FRAME_BATCH, records)
+        decoded = [record for frame in frames for record in decode_frame(frame)[1]]
+        self.assertEqual(len(frames), 2)
+        self.assertEqual(decoded, [{"address": address, "altitude": fields["altitude"]} for address, fields in records])
+
+    def test_removal(self):
+        frames = adsb_server.encode_binary_removal(["484cb8", "~tisb01", "abcdef"])
+        self.assertEqual([decode_frame(frame) for frame in frames], [(FRAME_REMOVE, ["484cb8", "abcdef"])])
+        self.assertEqual(adsb_server.encode_binary_removal(["~tisb01"]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
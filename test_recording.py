@@ -0,0 +1,168 @@
+"""Round-trip test of the recording format in adsb_recording.py and of seeking in adsb_server's replay.
+
+A small recording is written with the Recorder, read back, indexed and truncated, then replayed with seeks
+to, just after and between keyframes; the table the seek rebuilds is compared with what was recorded.
+Usage: python -m unittest test_recording (or python -m pytest test_recording.py)
+"""
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import adsb_recording
+import adsb_server
+
+AIRCRAFT = 10
+STEPS = 30
+KEYFRAME_EVERY = 10 # Steps
+START = 1750000000.0 # Wall clock time of the first frame
+
+
+def address(number: int) -> str:
+    return f"a{number:05x}"
+
+
+def position(step: int, number: int) -> dict:
+    return {"address": address(number), "latitude": 52.0 + step * 0.001, "longitude": 6.0 + number * 0.01,
+            "altitude": 30000, "receiver": "test"}
+
+
+def build_frames() -> list:
+    """(monotonic time, wall time, source, payload) of the test recording: every aircraft reports once per second
+    (the first exactly on the second), with a keyframe of the positions so far every KEYFRAME_EVERY seconds."""
+    frames = []
+    for step in range(STEPS):
+        if step and step % KEYFRAME_EVERY == 0:
+            snapshot = {"type": "snapshot", "aircraft": [position(step - 1, number) for number in range(AIRCRAFT)]}
+            frames.append((100.0 + step, START + step, adsb_recording.KEYFRAME_SOURCE, json.dumps(snapshot).encode()))
+        for number in range(AIRCRAFT):
+            offset = step + number * 0.05
+            frames.append((100.0 + offset, START + offset, "ws://receiver", json.dumps(position(step, number)).encode()))
+    return frames
+
+
+class RecordingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="adsb-recording-test-")
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.frames = build_frames()
+        recorder = adsb_recording.Recorder(self.directory, block_bytes=1024)
+        recorder.start()
+        for frame in self.frames: # With their recorded times, record() would stamp the current time
+            recorder._queue.put(frame)
+        recorder.close()
+        self.segments = adsb_recording.segment_paths(self.directory)
+        self.keyframe_times = [START + step for step in range(KEYFRAME_EVERY, STEPS, KEYFRAME_EVERY)]
+
+
+class RecordingFormat(RecordingTestCase):
+    def test_frames_read_back_unchanged(self):
+        self.assertEqual(len(self.segments), 1)
+        read = [(received_at, wall_time, source, bytes(payload))
+                for received_at, wall_time, source, payload in adsb_recording.iter_recording(self.directory)]
+        self.assertEqual(read, self.frames)
+
+    def test_index_matches_blocks(self):
+        (segment,) = self.segments
+        entries = adsb_recording.read_index(segment)
+        self.assertGreater(len(entries), 2)
+        self.assertEqual(entries, adsb_recording.scan_index(segment))
+        self.assertEqual([wall_time for wall_time, _, flags in entries if flags & adsb_recording.INDEX_KEYFRAME],
+                         self.keyframe_times)
+        for wall_time, offset, flags in entries: # Every entry points at a block starting with the frame it describes
+            _, first_wall_time, source, _ = next(adsb_recording.iter_frames(segment, offset))
+            self.assertEqual(first_wall_time, wall_time)
+            self.assertEqual(source == adsb_recording.KEYFRAME_SOURCE, bool(flags & adsb_recording.INDEX_KEYFRAME))
+        self.assertEqual(adsb_recording.recording_range(self.directory), (START, entries[-1][0]))
+
+    def test_truncated_last_block_ends_the_segment(self):
+        (segment,) = self.segments
+        entries = adsb_recording.read_index(segment)
+        os.remove(adsb_recording.index_path(segment))
+        with open(segment, "r+b") as file: # Recorder killed while writing the last block
+            file.truncate(os.path.getsize(segment) - 10)
+        last_block = sum(1 for frame in self.frames if frame[1] >= entries[-1][0])
+        with self.assertLogs(adsb_recording.logger, "WARNING"):
+            read = [(received_at, wall_time, source, bytes(payload))
+                    for received_at, wall_time, source, payload in adsb_recording.iter_frames(segment)]
+        self.assertEqual(read, self.frames[:-last_block])
+        self.assertEqual(adsb_recording.read_index(segment), entries[:-1])
+
+    def test_find_keyframe(self):
+        entries = adsb_recording.read_index(self.segments[0])
+        offsets = {wall_time: offset for wall_time, offset, flags in entries if flags & adsb_recording.INDEX_KEYFRAME}
+        first, second = self.keyframe_times
+        self.assertEqual(adsb_recording.find_keyframe(self.segments, START + 5), (0, None))
+        self.assertEqual(adsb_recording.find_keyframe(self.segments, first), (0, offsets[first]))
+        self.assertEqual(adsb_recording.find_keyframe(self.segments, first + 0.001), (0, offsets[first]))
+        self.assertEqual(adsb_recording.find_keyframe(self.segments, second - 0.001), (0, offsets[first]))
+        self.assertEqual(adsb_recording.find_keyframe(self.segments, START + STEPS), (0, offsets[second]))
+        frames = adsb_recording.iter_recording(self.directory, first + 0.5)
+        self.assertEqual(next(frames)[1:3], (first, adsb_recording.KEYFRAME_SOURCE))
+
+    def test_parse_seek_time(self):
+        last = START + STEPS
+        self.assertEqual(adsb_recording.parse_seek_time(START + 12.5, START, last), START + 12.5)
+        self.assertEqual(adsb_recording.parse_seek_time(str(START + 12.5), START, last), START + 12.5)
+        iso = datetime.fromtimestamp(START + 12).isoformat()
+        self.assertEqual(adsb_recording.parse_seek_time(iso, START, last), START + 12)
+        time_of_day = datetime.fromtimestamp(START + 12).strftime("%H:%M:%S")
+        self.assertEqual(adsb_recording.parse_seek_time(time_of_day, START, last), START + 12)
+        for value in (START - 3600, "25:00", "yesterday", None, [START]):
+            with self.assertRaises(ValueError):
+                adsb_recording.parse_seek_time(value, START, last)
+
+
+class ReplaySeek(RecordingTestCase):
+    def seek(self, wall_time: float) -> dict:
+        """Replays the test recording, seeks to wall_time and returns the fields of every aircraft in the table
+        at the moment clients are resynced."""
+        seen = {}
+
+        def capture(dropped=()):
+            seen.update((state.address, dict(state.fields)) for state in adsb_server.AIRCRAFT_TABLE.states())
+            adsb_server.shutdown_event.set()
+
+        async def replay():
+            adsb_server.shutdown_event = asyncio.Event()
+            adsb_server.replay_seek_event = asyncio.Event()
+            task = asyncio.create_task(adsb_server.replay_recording(self.directory, 1.0))
+            await asyncio.sleep(0.1)
+            adsb_server.request_replay_seek(wall_time)
+            await asyncio.wait_for(task, 5)
+
+        adsb_server.AIRCRAFT_TABLE.clear()
+        self.addCleanup(adsb_server.AIRCRAFT_TABLE.clear)
+        with mock.patch.object(adsb_server, "REPLAY_PATH", self.directory), \
+                mock.patch.object(adsb_server, "resync_clients", side_effect=capture):
+            asyncio.run(replay())
+        return seen
+
+    def assert_positions(self, seen: dict, steps: dict):
+        self.assertEqual(sorted(seen), sorted(address(number) for number in range(AIRCRAFT)))
+        for number in range(AIRCRAFT):
+            expected = position(steps.get(number, steps.get(None)), number)
+            expected.pop("address")
+            self.assertEqual({name: seen[address(number)].get(name) for name in expected}, expected)
+
+    def test_seek_to_keyframe(self):
+        first = self.keyframe_times[0]
+        self.assert_positions(self.seek(first), {None: KEYFRAME_EVERY - 1})
+
+    def test_seek_just_after_keyframe(self):
+        first = self.keyframe_times[0]
+        self.assert_positions(self.seek(first + 0.001), {None: KEYFRAME_EVERY - 1, 0: KEYFRAME_EVERY})
+
+    def test_seek_between_keyframes(self):
+        self.assert_positions(self.seek(START + 15.5), {None: 15})
+
+    def test_seek_before_first_keyframe(self):
+        self.assert_positions(self.seek(START + 3.12), {None: 2, 0: 3, 1: 3, 2: 3})
+
+
+if __name__ == "__main__":
+    unittest.main()
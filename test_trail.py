@@ -0,0 +1,145 @@
+"""Test of the trail simplification and ring buffer in adsb_server.Trail.
+
+Synthetic tracks are fed one position per second; every position the simplifier dropped must lie within
+TRAIL_SIMPLIFY_TOLERANCE_M of the line between the kept points around it, and within TRAIL_SIMPLIFY_ALTITUDE_FT
+of the altitude interpolated along that line.
+Usage: python -m unittest test_trail (or python -m pytest test_trail.py)
+"""
+import math
+import random
+import unittest
+from unittest import mock
+
+import adsb_server
+
+METERS_PER_DEGREE_LATITUDE = 111133.0
+METERS_PER_DEGREE_LONGITUDE = 111320.0 # At the equator
+
+
+def local_meters(origin: list, point: list):
+    """(north, east) of point from origin in meters, flat earth around origin."""
+    return ((point[0] - origin[0]) * METERS_PER_DEGREE_LATITUDE,
+            (point[1] - origin[1]) * METERS_PER_DEGREE_LONGITUDE * math.cos(math.radians(origin[0])))
+
+
+def fly(turns: list, start=(52.2, 6.85, 3000.0), speed_ms: float = 120.0):
+    """[latitude, longitude, altitude, time] once per second along (seconds, turn rate deg/s, climb ft/s) legs."""
+    latitude, longitude, altitude = start
+    heading = 30.0
+    points = []
+    at = 0.0
+    for seconds, turn_rate, climb in turns:
+        for _ in range(seconds):
+            heading += turn_rate
+            latitude += speed_ms * math.cos(math.radians(heading)) / METERS_PER_DEGREE_LATITUDE
+            longitude += speed_ms * math.sin(math.radians(heading)) / (METERS_PER_DEGREE_LONGITUDE * math.cos(math.radians(latitude)))
+            altitude = None if climb is None else (altitude or 3000.0) + climb
+            at += 1.0
+            points.append([latitude, longitude, altitude, at])
+    return points
+
+
+def jitter(points: list, meters: float, feet: float, seed: int = 1):
+    """Points with receiver noise of up to meters horizontally and feet vertically."""
+    rng = random.Random(seed)
+    noisy = []
+    for latitude, longitude, altitude, at in points:
+        latitude += rng.uniform(-meters, meters) / METERS_PER_DEGREE_LATITUDE
+        longitude += rng.uniform(-meters, meters) / (METERS_PER_DEGREE_LONGITUDE * math.cos(math.radians(latitude)))
+        noisy.append([latitude, longitude, None if altitude is None else altitude + rng.uniform(-feet, feet), at])
+    return noisy
+
+
+def build(points: list, capacity: int = 10000) -> adsb_server.Trail:
+    trail = adsb_server.Trail(capacity)
+    for latitude, longitude, altitude, at in points:
+        trail.append(latitude, longitude, altitude, at)
+    return trail
+
+
+TRACKS = {
+    "straight": fly([(300, 0.0, 0.0)]),
+    "noisy straight": jitter(fly([(300, 0.0, 0.0)]), 20.0, 30.0),
+    "standard rate turns": fly([(60, 0.0, 0.0), (60, 3.0, 0.0), (30, 0.0, 0.0), (120, -3.0, 0.0)]),
+    "slow circle": fly([(720, 0.5, 0.0)]),
+    "climb and level off": fly([(120, 0.0, 25.0), (60, 0.0, 0.0), (90, 1.0, -15.0), (60, 0.0, 0.0)]),
+    "noisy climbing turn": jitter(fly([(200, 1.5, 20.0)]), 15.0, 50.0, seed=2),
+    "altitude lost and back": fly([(60, 0.0, 0.0), (40, 0.0, None), (60, 2.0, 0.0)]),
+    "reversal": fly([(60, 0.0, 0.0), (1, 180.0, 0.0), (60, 0.0, 0.0)]),
+    "holding pattern": fly([(60, 0.0, 0.0), (60, 3.0, 0.0), (60, 0.0, 0.0), (60, 3.0, 0.0)] * 3, speed_ms=90.0),
+}
+
+
+class TrailSimplification(unittest.TestCase):
+    def assert_within_tolerance(self, name: str, points: list, kept: list):
+        tolerance = adsb_server.TRAIL_SIMPLIFY_TOLERANCE_M
+        feet = adsb_server.TRAIL_SIMPLIFY_ALTITUDE_FT
+        self.assertEqual(kept[0], points[0], name)
+        self.assertEqual(kept[-1], points[-1], name)
+        kept_times = [point[3] for point in kept]
+        self.assertEqual(kept_times, sorted(set(kept_times)), name)
+        segment = 0
+        for point in points:
+            while kept[segment + 1][3] < point[3]:
+                segment += 1
+            start, end = kept[segment], kept[segment + 1]
+            if point[3] in (start[3], end[3]):
+                self.assertIn(point, (start, end), name)
+                continue
+            end_north, end_east = local_meters(start, end)
+            north, east = local_meters(start, point)
+            length = math.hypot(end_north, end_east)
+            along = 0.0 if length == 0 else max(0.0, min(1.0, (north * end_north + east * end_east) / length ** 2))
+            off_line = math.hypot(north - along * end_north, east - along * end_east)
+            self.assertLessEqual(off_line, tolerance + 1e-6, f"{name}: point at {point[3]:.0f}s is {off_line:.1f} m off")
+            self.assertEqual(point[2] is None, start[2] is None, name)
+            if point[2] is not None and end[2] is not None:
+                # The simplifier interpolates altitude by distance from the start of the line
+                distance = max(math.hypot(north, east), 1.0)
+                expected = start[2] + (end[2] - start[2]) / max(length, 1.0) * distance
+                self.assertLessEqual(abs(point[2] - expected), feet + 1e-6,
+                                     f"{name}: point at {point[3]:.0f}s is {point[2] - expected:.0f} ft off")
+
+    def test_dropped_points_stay_within_tolerance(self):
+        for name, points in TRACKS.items():
+            with self.subTest(name):
+                trail = build(points)
+                kept = trail.to_list()
+                self.assert_within_tolerance(name, points, kept)
+                self.assertLess(len(kept), len(points), name)
+
+    def test_straight_track_needs_two_points(self):
+        self.assertEqual(len(build(TRACKS["straight"])), 2)
+
+    def test_turn_is_kept(self):
+        kept = build(TRACKS["reversal"]).to_list()
+        self.assertGreaterEqual(len(kept), 3)
+        self.assertIn(TRACKS["reversal"][59], kept) # Where it turned around
+
+    def test_without_tolerance_every_point_is_kept(self):
+        points = TRACKS["noisy straight"]
+        with mock.patch.object(adsb_server, "TRAIL_SIMPLIFY_TOLERANCE_M", 0):
+            self.assertEqual(build(points).to_list(), points)
+
+
+class TrailRingBuffer(unittest.TestCase):
+    def test_wraps_around_at_capacity(self):
+        points = TRACKS["noisy straight"][:23]
+        with mock.patch.object(adsb_server, "TRAIL_SIMPLIFY_TOLERANCE_M", 0):
+            trail = adsb_server.Trail(5)
+            added = [trail.append(*point) for point in points]
+            self.assertEqual(added, [1] * 5 + [0] * 18)
+            self.assertEqual(len(trail), 5)
+            self.assertEqual(trail.to_list(), points[-5:])
+
+    def test_simplifies_across_the_wrap(self):
+        points = TRACKS["holding pattern"]
+        complete = build(points).to_list()
+        for capacity in (2, 3, 7, 10):
+            with self.subTest(capacity=capacity):
+                self.assertGreater(len(complete), capacity)
+                self.assertEqual(build(points, capacity).to_list(), complete[-capacity:])
+
+
+if __name__ == "__main__":
+    unittest.main()